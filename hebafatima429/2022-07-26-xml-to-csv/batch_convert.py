@@ -0,0 +1,89 @@
+import os
+import csv
+import sys
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor
+from main import convert_xml_to_csv, RECORD_TAG
+
+SOURCE_COLUMN = 'SOURCE_FILE'
+
+# input files of a directory (every *.xml in it) or a glob pattern, sorted so runs are reproducible
+def find_xml_files(path_or_pattern):
+    if os.path.isdir(path_or_pattern):
+        path_or_pattern = os.path.join(path_or_pattern, '*.xml')
+    return sorted(glob.glob(path_or_pattern))
+
+# one worker converts one file with the streaming converter and reports its stats
+def convert_file(xml_path, csv_path, record_tag=RECORD_TAG):
+    start_time = time.time()
+    columns, num_rows = convert_xml_to_csv(xml_path, csv_path, record_tag)
+    return {
+        'file': xml_path,
+        'csv': csv_path,
+        'columns': columns,
+        'rows': num_rows,
+        'bytes': os.path.getsize(xml_path),
+        'seconds': time.time() - start_time,
+    }
+
+# concatenate per file CSVs into one, columns are the union in first seen order with the source file name in front
+def merge_csv_files(results, merged_path):
+    column_index = dict.fromkeys([SOURCE_COLUMN])
+    for result in results:
+        column_index.update(dict.fromkeys(result['columns']))
+    columns = list(column_index)
+    num_rows = 0
+    with open(merged_path, 'w', newline='', encoding='utf-8') as merged_file:
+        writer = csv.writer(merged_file, lineterminator='\n')
+        writer.writerow(columns)
+        for result in results:
+            source = os.path.basename(result['file'])
+            with open(result['csv'], newline='', encoding='utf-8') as csv_file:
+                reader = csv.reader(csv_file)
+                positions = {column: i for i, column in enumerate(next(reader))}
+                order = [positions.get(column) for column in columns[1:]]
+                for row in reader:
+                    writer.writerow([source] + [row[i] if i is not None else '' for i in order])
+                    num_rows += 1
+    print('merged', len(results), 'files into', merged_path, 'rows:', num_rows)
+    return columns, num_rows
+
+# convert every XML file of a directory or glob in parallel, one streaming parse per worker process
+# per file CSVs are written into out_dir; with merged_path they are also concatenated and then removed
+def convert_batch(path_or_pattern, out_dir, num_workers=None, merged_path=None, record_tag=RECORD_TAG):
+    xml_paths = find_xml_files(path_or_pattern)
+    if not xml_paths:
+        raise FileNotFoundError(f'no XML files found for {path_or_pattern}')
+    names = [os.path.splitext(os.path.basename(xml_path))[0] for xml_path in xml_paths]
+    if len(set(names)) != len(names):
+        raise ValueError(f'input file names are not unique: {names}')
+    num_workers = min(num_workers or os.cpu_count(), len(xml_paths))
+    os.makedirs(out_dir, exist_ok=True)
+    print('converting', len(xml_paths), 'files with', num_workers, 'workers')
+    start_time = time.time()
+
+    with ProcessPoolExecutor(num_workers) as executor:
+        futures = [executor.submit(convert_file, xml_path, os.path.join(out_dir, name + '.csv'), record_tag)
+                   for xml_path, name in zip(xml_paths, names)]
+        results = [future.result() for future in futures]
+
+    for result in results:
+        print(f'[{os.path.basename(result["file"])}] rows: {result["rows"]}, bytes: {result["bytes"]}, '
+              f'seconds: {result["seconds"]:.2f}')
+    if merged_path:
+        merge_csv_files(results, merged_path)
+        for result in results:
+            os.remove(result['csv'])
+    elapsed = time.time() - start_time
+    total_bytes = sum(result['bytes'] for result in results)
+    print('[total] files:', len(results), 'rows:', sum(result['rows'] for result in results), 'bytes:', total_bytes,
+          f'time: {elapsed:.2f}s ({total_bytes / max(elapsed, 1e-9) / 2**20:.1f} MB/s)')
+    return results
+
+if __name__ == '__main__':
+    # python batch_convert.py <directory or glob> [out_dir] [merged.csv]
+    path_or_pattern = sys.argv[1] if len(sys.argv) > 1 else '.'
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else 'output'
+    merged_path = sys.argv[3] if len(sys.argv) > 3 else None
+    convert_batch(path_or_pattern, out_dir, merged_path=merged_path)
@@ -0,0 +1,34 @@
+import os
+import sys
+import time
+import tempfile
+import pandas as pd
+from main import convert_xml_to_csv, convert_xml_to_frame
+
+# end-to-end timing of previous script (write CSV, re-read it, astype(object)) against typed single pass
+def previous_pipeline(xml_path, csv_path):
+    convert_xml_to_csv(xml_path, csv_path)
+    df_data = pd.read_csv(csv_path)
+    return df_data.astype(object)
+
+def typed_pipeline(xml_path, csv_path):
+    return convert_xml_to_frame(xml_path, csv_path)
+
+# runs of both pipelines are interleaved and the median is reported, so background load affects both alike
+def benchmark(xml_path, repeats=21):
+    pipelines = {'csv round-trip': previous_pipeline, 'typed single pass': typed_pipeline}
+    timings = {name: [] for name in pipelines}
+    # CSV files of the runs go to a temporary directory which is removed afterwards
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for _ in range(repeats):
+            for name, pipeline in pipelines.items():
+                start_time = time.time()
+                pipeline(xml_path, os.path.join(tmp_dir, f'benchmark-{name.replace(" ", "-")}.csv'))
+                timings[name].append(time.time() - start_time)
+    medians = {name: sorted(seconds)[len(seconds) // 2] for name, seconds in timings.items()}
+    for name, seconds in medians.items():
+        print(f'[{name}] median of {repeats}: {seconds * 1000:.1f} ms')
+    return medians
+
+if __name__ == '__main__':
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else 'input.xml')
@@ -0,0 +1,175 @@
+import os
+import re
+import time
+from main import iter_records, RECORD_TAG
+
+# column types of typed output
+INT, FLOAT, DATE, CATEGORY, STRING = 'int', 'float', 'date', 'category', 'string'
+DATE_FORMAT = '%d/%m/%Y'
+
+INT_PATTERN = re.compile(r'[+-]?\d+')
+FLOAT_PATTERN = re.compile(r'[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?')
+DATE_PATTERN = re.compile(r'\d{2}/\d{2}/\d{4}')
+# identifiers (PERSON_ID, PERSON_NUMBER, ...) stay strings even if they look numeric, an int would drop leading zeros
+IDENTIFIER_PATTERN = re.compile(r'.*_(ID|NUMBER)')
+
+# columns with fewer distinct values than this (and less than half of the rows) become categoricals
+MAX_CATEGORIES = 1000
+
+# infer type of every G_1 field in one streaming pass; empty values are nulls and do not decide the type
+def infer_schema(xml_path, record_tag=RECORD_TAG, max_rows=None):
+    candidates = {}
+    distinct = {}
+    counts = {}
+    for i, record in enumerate(iter_records(xml_path, record_tag)):
+        if max_rows is not None and i >= max_rows:
+            break
+        for tag, value in record.items():
+            if tag not in candidates:
+                candidates[tag] = {INT, FLOAT, DATE}
+                distinct[tag] = set()
+                counts[tag] = 0
+            if not value:
+                continue
+            counts[tag] += 1
+            types = candidates[tag]
+            if INT in types and not INT_PATTERN.fullmatch(value):
+                types.discard(INT)
+            if FLOAT in types and not FLOAT_PATTERN.fullmatch(value):
+                types.discard(FLOAT)
+            if DATE in types and not DATE_PATTERN.fullmatch(value):
+                types.discard(DATE)
+            if len(distinct[tag]) <= MAX_CATEGORIES:
+                distinct[tag].add(value)
+
+    schema = {}
+    for tag, types in candidates.items():
+        if counts[tag] == 0 or IDENTIFIER_PATTERN.fullmatch(tag):
+            schema[tag] = STRING
+        elif INT in types:
+            schema[tag] = INT
+        elif FLOAT in types:
+            schema[tag] = FLOAT
+        elif DATE in types:
+            schema[tag] = DATE
+        elif len(distinct[tag]) <= MAX_CATEGORIES and len(distinct[tag]) * 2 <= counts[tag]:
+            schema[tag] = CATEGORY
+        else:
+            schema[tag] = STRING
+    return schema
+
+# arrow types of schema, pyarrow is only needed for typed output
+def arrow_schema(schema):
+    import pyarrow as pa
+    arrow_types = {
+        INT: pa.int64(),
+        FLOAT: pa.float64(),
+        DATE: pa.date32(),
+        CATEGORY: pa.dictionary(pa.int32(), pa.string()),
+        STRING: pa.string(),
+    }
+    return pa.schema([(tag, arrow_types[kind]) for tag, kind in schema.items()])
+
+class BatchEncoder:
+    # categoricals keep one dictionary over the whole file which only grows at the end,
+    # so batches can be written as Arrow IPC dictionary deltas as well as Parquet row groups
+    def __init__(self, schema):
+        import pyarrow as pa
+        self.pa = pa
+        self.schema = schema
+        self.arrow_schema = arrow_schema(schema)
+        self.categories = {tag: {} for tag, kind in schema.items() if kind == CATEGORY}
+
+    def encode_column(self, tag, values):
+        pa, kind = self.pa, self.schema[tag]
+        if kind == INT:
+            return pa.array([int(value) if value else None for value in values], pa.int64())
+        if kind == FLOAT:
+            return pa.array([float(value) if value else None for value in values], pa.float64())
+        if kind == DATE:
+            import pyarrow.compute as pc
+            timestamps = pc.strptime(pa.array([value or None for value in values], pa.string()), format=DATE_FORMAT, unit='s')
+            return timestamps.cast(pa.date32())
+        if kind == CATEGORY:
+            codes = self.categories[tag]
+            indices = [codes.setdefault(value, len(codes)) if value else None for value in values]
+            return pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), pa.array(list(codes), pa.string()))
+        return pa.array([value if value else None for value in values], pa.string())
+
+    def encode(self, rows):
+        columns = []
+        for tag in self.schema:
+            try:
+                columns.append(self.encode_column(tag, [row.get(tag, '') for row in rows]))
+            except (ValueError, self.pa.ArrowInvalid) as e:
+                # e.g. schema inferred from the first max_rows rows only
+                raise ValueError(f'column {tag} does not fit schema type {self.schema[tag]}: {e}') from e
+        return self.pa.record_batch(columns, schema=self.arrow_schema)
+
+# XML to Parquet / Arrow IPC file, rows are encoded and written in batches (one Parquet row group each)
+# the file is written to a temporary path and renamed at the end, so a record which does not fit the schema
+# never leaves a half written file at out_path
+def convert_xml_to_columnar(xml_path, out_path, schema=None, out_format='parquet', batch_size=65536, record_tag=RECORD_TAG):
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+
+    if schema is None:
+        schema = infer_schema(xml_path, record_tag)
+    print('[schema]', schema)
+    encoder = BatchEncoder(schema)
+    tmp_path = out_path + '.tmp'
+    if out_format == 'parquet':
+        writer = pq.ParquetWriter(tmp_path, encoder.arrow_schema, compression='zstd')
+        write_batch = lambda batch: writer.write_batch(batch, row_group_size=batch_size)
+    elif out_format == 'arrow':
+        writer = ipc.new_file(tmp_path, encoder.arrow_schema, options=ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+        write_batch = writer.write_batch
+    else:
+        raise ValueError(f'unknown output format: {out_format}')
+
+    num_rows = 0
+    rows = []
+    try:
+        with writer:
+            for record in iter_records(xml_path, record_tag):
+                for tag in record:
+                    if tag not in schema:
+                        raise ValueError(f'column {tag} of row {num_rows + len(rows)} is not in schema')
+                rows.append(record)
+                if len(rows) == batch_size:
+                    write_batch(encoder.encode(rows))
+                    num_rows += len(rows)
+                    rows = []
+            if rows:
+                write_batch(encoder.encode(rows))
+                num_rows += len(rows)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, out_path)
+    print('[rows]', num_rows)
+    print(out_format, 'file saved at:', out_path)
+    return schema, num_rows
+
+if __name__ == '__main__':
+    import pandas as pd
+    import pyarrow.ipc as ipc
+
+    schema = infer_schema('heba_test_1_final.xml')
+    convert_xml_to_columnar('heba_test_1_final.xml', 'output.parquet', schema)
+    convert_xml_to_columnar('heba_test_1_final.xml', 'output.arrow', schema, out_format='arrow')
+
+    # compare downstream loads with typed dates against CSV, which has to re-parse them on every read
+    date_columns = [tag for tag, kind in schema.items() if kind == DATE]
+    loaders = {
+        'output.csv': lambda: pd.read_csv('output.csv', parse_dates=date_columns, dayfirst=True),
+        'output.parquet': lambda: pd.read_parquet('output.parquet'),
+        'output.arrow': lambda: ipc.open_file('output.arrow').read_pandas(),
+    }
+    for path, load in loaders.items():
+        if not os.path.exists(path):
+            continue
+        start_time = time.time()
+        for _ in range(10):
+            load()
+        print(f'[{path}] size: {os.path.getsize(path) / 1024:.0f} KB, load: {(time.time() - start_time) / 10 * 1000:.1f} ms')
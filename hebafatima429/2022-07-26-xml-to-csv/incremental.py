@@ -0,0 +1,118 @@
+import os
+import csv
+import shutil
+import hashlib
+from main import convert_xml_to_csv, iter_records, RECORD_TAG
+
+# a person can have several rows of the same plan (one per assignment), so the occurrence number
+# of the key in export order is part of the key as well; the export has no assignment or row identifier to key on
+# limitation: if one of these rows is removed or reordered, the later rows of the same key shift by one occurrence,
+# so they are reported as changed and the last occurrence as deleted
+KEY_COLUMNS = ['PERSON_ID', 'ABSPLANINIT']
+# columns which change with every export (TODAY is the export date), they are not part of the record hash
+# so a record is only changed when its data changes; the snapshot still has their current values
+VOLATILE_COLUMNS = ['TODAY']
+CHANGE_COLUMN = 'CHANGE'
+INSERTED, CHANGED, DELETED = 'inserted', 'changed', 'deleted'
+
+# hash of all fields of a record except volatile ones, independent of field order, 12 bytes are plenty for a daily export
+def record_hash(record, volatile_columns=VOLATILE_COLUMNS):
+    fields = '\x1e'.join(f'{tag}\x1f{value}' for tag, value in sorted(record.items()) if tag not in volatile_columns)
+    return hashlib.blake2b(fields.encode('utf-8'), digest_size=12).hexdigest()
+
+# index file is a CSV of key columns, occurrence number and record hash, one line per record of the snapshot
+def load_index(index_path, key_columns=KEY_COLUMNS):
+    index = {}
+    if not os.path.exists(index_path):
+        return index
+    with open(index_path, newline='', encoding='utf-8') as index_file:
+        reader = csv.reader(index_file)
+        header = next(reader, None)
+        if header != key_columns + ['OCCURRENCE', 'HASH']:
+            raise ValueError(f'index {index_path} has columns {header}, expected keys {key_columns}')
+        for *key, occurrence, digest in reader:
+            index[(*key, int(occurrence))] = digest
+    return index
+
+def save_index(index, index_path, key_columns=KEY_COLUMNS):
+    with open(index_path, 'w', newline='', encoding='utf-8') as index_file:
+        writer = csv.writer(index_file, lineterminator='\n')
+        writer.writerow(key_columns + ['OCCURRENCE', 'HASH'])
+        writer.writerows((*key, digest) for key, digest in index.items())
+
+# convert today's export against the index of the previous one
+# snapshot_path gets the full CSV (same as convert_xml_to_csv) and index_path its record hashes,
+# delta_path only gets inserted and changed rows and the keys of deleted rows, with the kind of change and
+# the occurrence number of the key in front, so a consumer knows which of several rows of a key it is
+# delta rows are streamed like convert_xml_to_csv does: written before the header and padded if columns grew
+# snapshot and index are written to temporary files and renamed at the end, so a failed run keeps the previous state
+def convert_incremental(xml_path, snapshot_path, delta_path, index_path, key_columns=KEY_COLUMNS,
+                        volatile_columns=VOLATILE_COLUMNS, record_tag=RECORD_TAG):
+    old_index = load_index(index_path, key_columns)
+    new_index = {}
+    occurrences = {}
+    counts = {INSERTED: 0, CHANGED: 0, DELETED: 0}
+    column_index = {}
+    delta_state = {'columns': [], 'num_rows': 0, 'grown': False}
+    delta_body_path = delta_path + '.body.tmp'
+
+    # every record adds its columns, also unchanged ones, so delta and snapshot columns are in the same order
+    def add_columns(record):
+        for tag in record:
+            if tag not in column_index:
+                column_index[tag] = None
+                delta_state['columns'] = list(column_index)
+                delta_state['grown'] = delta_state['grown'] or delta_state['num_rows'] > 0
+
+    def write_delta(writer, change, occurrence, record):
+        writer.writerow([change, occurrence] + [record.get(column, '') for column in delta_state['columns']])
+        delta_state['num_rows'] += 1
+        counts[change] += 1
+
+    def tracked_records(delta_writer):
+        for record in iter_records(xml_path, record_tag):
+            key_values = tuple(record.get(column, '') for column in key_columns)
+            occurrence = occurrences.get(key_values, 0)
+            occurrences[key_values] = occurrence + 1
+            key = (*key_values, occurrence)
+            digest = record_hash(record, volatile_columns)
+            new_index[key] = digest
+            add_columns(record)
+            old_digest = old_index.get(key)
+            if old_digest is None:
+                write_delta(delta_writer, INSERTED, occurrence, record)
+            elif old_digest != digest:
+                write_delta(delta_writer, CHANGED, occurrence, record)
+            yield record
+
+    snapshot_tmp_path = snapshot_path + '.tmp'
+    with open(delta_body_path, 'w', newline='', encoding='utf-8') as delta_body_file:
+        delta_writer = csv.writer(delta_body_file, lineterminator='\n')
+        columns, num_rows = convert_xml_to_csv(xml_path, snapshot_tmp_path, record_tag, records=tracked_records(delta_writer))
+        for key in old_index:
+            if key not in new_index:
+                *key_values, occurrence = key
+                write_delta(delta_writer, DELETED, occurrence, dict(zip(key_columns, key_values)))
+
+    with open(delta_path, 'w', newline='', encoding='utf-8') as delta_file:
+        writer = csv.writer(delta_file, lineterminator='\n')
+        writer.writerow([CHANGE_COLUMN, 'OCCURRENCE'] + columns)
+        with open(delta_body_path, newline='', encoding='utf-8') as delta_body_file:
+            if not delta_state['grown']:
+                shutil.copyfileobj(delta_body_file, delta_file)
+            else:
+                for row in csv.reader(delta_body_file):
+                    writer.writerow(row + [''] * (len(columns) + 2 - len(row)))
+    os.remove(delta_body_path)
+
+    index_tmp_path = index_path + '.tmp'
+    save_index(new_index, index_tmp_path, key_columns)
+    os.replace(snapshot_tmp_path, snapshot_path)
+    os.replace(index_tmp_path, index_path)
+
+    print('[delta]', counts, 'of', num_rows, 'rows, saved at:', delta_path)
+    return counts
+
+if __name__ == '__main__':
+    # first run has no index, so every row is inserted; later runs only write what changed since the previous run
+    convert_incremental('heba_test_1_final.xml', 'output.csv', 'output.delta.csv', 'output.index.csv')
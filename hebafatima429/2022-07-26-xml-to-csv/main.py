@@ -1,39 +1,165 @@
+import os
+import csv
+import sys
+import shutil
+from array import array
+import numpy as np
 import pandas as pd
 import xml.etree.ElementTree as ET
-from collections import defaultdict
-
-# load XML file
-tree = ET.parse('heba_test_1_final.xml')
-root = tree.getroot()
-
-# XML to JSON (list of python dictionaries)
-data_json = []
-columns = []
-for i, child_G_1 in enumerate(list(root.iter('G_1'))):
-    data_dict = {}
-    for j, child in enumerate(child_G_1):
-        if child.tag not in columns:
-            columns.append(child.tag)
-        data_dict[child.tag] = child.text.strip() if child.text else ''
-    data_json.append(data_dict)
-
-print('[columns]', len(columns), columns)
-print('[data_json]', len(data_json))
-
-# JSON (python dictionary) to CSV
-data_csv = defaultdict(list)
-for obj in data_json:
-    for column in columns:
-        value = obj[column] if column in obj else ''
-        data_csv[column].append(value)
-
-# save CSV file
-df_data = pd.DataFrame(data_csv)
-df_data.to_csv('output.csv', index=False)
-print('CSV file saved at: output.csv')
-
-# load and convert dtypes to object
-df_data = pd.read_csv('output.csv')
-print('[df_data]\n', df_data.dtypes)
-df_data = df_data.astype(object)
-print('[df_data]\n', df_data.dtypes)
+
+RECORD_TAG = 'G_1'
+# typed columns of final frame, all other columns stay strings (object)
+NUMERIC_COLUMNS = ['USED', 'EXP', 'CARRIEDOVER', 'ENTITLEMENT']
+DATE_COLUMNS = ['HIRE_DATE']
+DATE_FORMAT = '%d/%m/%Y'
+
+# stream records of XML file one at a time, each G_1 element is removed from the tree once it is read
+def iter_records(xml_path, record_tag=RECORD_TAG):
+    stack = []
+    for event, elem in ET.iterparse(xml_path, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag != record_tag:
+            continue
+        record = {}
+        for child in elem:
+            record[child.tag] = child.text.strip() if child.text else ''
+        yield record
+        # free memory of this record
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+# fast first pass which only collects column names of records, in first seen order
+# a dict is used as ordered set, so every membership check is O(1)
+def discover_columns(xml_path, record_tag=RECORD_TAG):
+    column_index = {}
+    for record in iter_records(xml_path, record_tag):
+        for tag in record:
+            if tag not in column_index:
+                column_index[tag] = None
+    return list(column_index)
+
+# schema hint file, one column name per line
+def load_column_hint(path):
+    with open(path, encoding='utf-8') as hint_file:
+        return [line.strip() for line in hint_file if line.strip()]
+
+def save_column_hint(columns, path):
+    with open(path, 'w', encoding='utf-8') as hint_file:
+        hint_file.write('\n'.join(columns) + '\n')
+
+# XML to CSV, rows are written as they are parsed so memory does not grow with file size
+# with known columns (discover_columns or load_column_hint) rows go straight into the CSV file,
+# a record with a tag outside of them is an error
+# records can be given as an iterable of dicts instead of being parsed from xml_path (e.g. wrapped by incremental.py)
+def convert_xml_to_csv(xml_path, csv_path, record_tag=RECORD_TAG, columns=None, records=None):
+    fixed_columns = columns is not None
+    column_index = dict.fromkeys(columns or [])
+    columns = list(column_index)
+    num_rows = 0
+    columns_grown_at = None
+    body_path = csv_path + '.body.tmp'
+    # without known columns rows are written before the header, which is put in front at the end
+    # columns only ever grow at the end (first seen order), so earlier rows just lack trailing empty fields
+    with open(csv_path if fixed_columns else body_path, 'w', newline='', encoding='utf-8') as out_file:
+        writer = csv.writer(out_file, lineterminator='\n')
+        if fixed_columns:
+            writer.writerow(columns)
+        for record in records if records is not None else iter_records(xml_path, record_tag):
+            for tag in record:
+                if tag not in column_index:
+                    if fixed_columns:
+                        raise ValueError(f'column {tag} of row {num_rows} is not in given columns')
+                    column_index[tag] = None
+                    columns = list(column_index)
+                    if num_rows > 0 and columns_grown_at is None:
+                        columns_grown_at = num_rows
+            writer.writerow([record.get(column, '') for column in columns])
+            num_rows += 1
+
+    print('[columns]', len(columns), columns)
+    print('[rows]', num_rows)
+
+    # save CSV file
+    if not fixed_columns:
+        with open(csv_path, 'w', newline='', encoding='utf-8') as csv_file:
+            writer = csv.writer(csv_file, lineterminator='\n')
+            writer.writerow(columns)
+            with open(body_path, newline='', encoding='utf-8') as body_file:
+                if columns_grown_at is None:
+                    shutil.copyfileobj(body_file, csv_file)
+                else:
+                    for row in csv.reader(body_file):
+                        writer.writerow(row + [''] * (len(columns) - len(row)))
+        os.remove(body_path)
+    print('CSV file saved at:', csv_path)
+    return columns, num_rows
+
+# one buffer per column of the final frame, filled while records stream:
+# array('d') of float64 for numeric columns (NaN for empty values), lists of strings for dates and all other columns
+def new_column_buffer(column, num_rows, numeric_columns):
+    if column in numeric_columns:
+        return array('d', [np.nan]) * num_rows
+    return [''] * num_rows
+
+# XML to in-memory frame with typed columns, records are appended to the column buffers as they stream past,
+# the CSV file (if csv_path is given) is written by convert_xml_to_csv in the same pass
+# memory grows with file size, so this is an explicit opt-in, convert_xml_to_csv is the streaming default
+def convert_xml_to_frame(xml_path, csv_path=None, record_tag=RECORD_TAG,
+                         numeric_columns=NUMERIC_COLUMNS, date_columns=DATE_COLUMNS):
+    buffers = {}
+    # numeric and string buffers are kept apart, so the per record loop does not look up column types
+    numeric_buffers = {}
+    string_buffers = {}
+    num_rows = 0
+
+    def buffered_records():
+        nonlocal num_rows
+        for record in iter_records(xml_path, record_tag):
+            for tag in record:
+                if tag not in buffers:
+                    # column first seen now, earlier rows are empty in it
+                    buffers[tag] = new_column_buffer(tag, num_rows, numeric_columns)
+                    (numeric_buffers if tag in numeric_columns else string_buffers)[tag] = buffers[tag]
+            get = record.get
+            for column, buffer in string_buffers.items():
+                buffer.append(get(column, ''))
+            for column, buffer in numeric_buffers.items():
+                value = get(column)
+                try:
+                    buffer.append(float(value) if value else np.nan)
+                except ValueError:
+                    raise ValueError(f'value {value!r} of column {column} in row {num_rows} is not numeric') from None
+            num_rows += 1
+            yield record
+
+    if csv_path:
+        convert_xml_to_csv(xml_path, csv_path, record_tag, records=buffered_records())
+    else:
+        for _ in buffered_records():
+            pass
+
+    data = {}
+    for column, buffer in buffers.items():
+        if column in numeric_columns:
+            # array('d') is float64 already, no copy
+            data[column] = np.frombuffer(buffer, dtype=np.float64)
+        elif column in date_columns:
+            data[column] = pd.to_datetime(buffer, format=DATE_FORMAT)
+        else:
+            data[column] = pd.Series(buffer, dtype=object)
+    return pd.DataFrame(data, columns=list(buffers))
+
+if __name__ == '__main__':
+    if '--frame' in sys.argv:
+        # opt-in: typed frame in memory and CSV written once in the same pass, no re-read of output.csv
+        df_data = convert_xml_to_frame('heba_test_1_final.xml', 'output.csv')
+        print('[df_data]\n', df_data.dtypes)
+    else:
+        # streaming, memory does not grow with file size
+        convert_xml_to_csv('heba_test_1_final.xml', 'output.csv')
+    # with schema hint file, rows are written directly without temporary file
+    # convert_xml_to_csv('heba_test_1_final.xml', 'output.csv', columns=load_column_hint('columns.txt'))
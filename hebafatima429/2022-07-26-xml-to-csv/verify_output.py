@@ -1,4 +1,86 @@
-import pandas as pd
-df_given = pd.read_csv('heba_test_1_final.csv')
-df_output = pd.read_csv('output.csv')
-print(all(df_given == df_output))
+import sys
+import csv
+from itertools import islice, zip_longest
+
+CHUNK_ROWS = 10000
+BLOCK_SIZE = 1 << 20
+
+# exit status: 0 identical, 1 different, 2 file could not be read
+EXIT_SAME, EXIT_DIFFERENT, EXIT_ERROR = 0, 1, 2
+
+# fast path: files with equal bytes are equal, read in fixed size blocks
+def same_bytes(given_path, output_path, block_size=BLOCK_SIZE):
+    with open(given_path, 'rb') as given_file, open(output_path, 'rb') as output_file:
+        while True:
+            block_given = given_file.read(block_size)
+            block_output = output_file.read(block_size)
+            if block_given != block_output:
+                return False
+            if not block_given:
+                return True
+
+# rows of CSV file in chunks, fields are compared as text so no value is changed by dtype inference
+def iter_chunks(reader, chunk_rows=CHUNK_ROWS):
+    while True:
+        chunk = list(islice(reader, chunk_rows))
+        if not chunk:
+            return
+        yield chunk
+
+def first_difference(row_given, row_output, columns):
+    for i, (value_given, value_output) in enumerate(zip_longest(row_given, row_output)):
+        if value_given != value_output:
+            column = columns[i] if i < len(columns) else f'#{i}'
+            return column, value_given, value_output
+
+# stream both files chunk by chunk, memory is bounded by chunk_rows whatever the file size
+# returns None if files are equal, else (row, column, given value, output value) of the first difference,
+# row 0 is the header, data rows start at 1
+# files which differ only in quoting or line endings are equal
+def compare_csv_files(given_path, output_path, chunk_rows=CHUNK_ROWS):
+    if same_bytes(given_path, output_path):
+        return None
+    with open(given_path, newline='', encoding='utf-8') as given_file, \
+         open(output_path, newline='', encoding='utf-8') as output_file:
+        reader_given = csv.reader(given_file)
+        reader_output = csv.reader(output_file)
+        header_given = next(reader_given, [])
+        header_output = next(reader_output, [])
+        if header_given != header_output:
+            return (0, *first_difference(header_given, header_output, header_given))
+
+        row_number = 1
+        chunks = zip_longest(iter_chunks(reader_given, chunk_rows), iter_chunks(reader_output, chunk_rows), fillvalue=[])
+        for chunk_given, chunk_output in chunks:
+            # whole chunk is compared in one C level list comparison, rows are only looked at on mismatch
+            if chunk_given != chunk_output:
+                for i, (row_given, row_output) in enumerate(zip_longest(chunk_given, chunk_output)):
+                    if row_given is None or row_output is None:
+                        # one file has more rows
+                        return row_number + i, None, row_given, row_output
+                    if row_given != row_output:
+                        return (row_number + i, *first_difference(row_given, row_output, header_given))
+            row_number += len(chunk_given)
+    return None
+
+def main(argv):
+    given_path = argv[1] if len(argv) > 1 else 'heba_test_1_final.csv'
+    output_path = argv[2] if len(argv) > 2 else 'output.csv'
+    try:
+        difference = compare_csv_files(given_path, output_path)
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        print('could not compare files:', e)
+        return EXIT_ERROR
+    if difference is None:
+        print('files are identical:', given_path, output_path)
+        return EXIT_SAME
+    row, column, value_given, value_output = difference
+    if column is None:
+        longer_path = given_path if value_given is not None else output_path
+        print(f'row count differs, {longer_path} has more rows from row {row}:', value_given or value_output)
+    else:
+        print(f'first difference at row {row}, column {column}: {value_given!r} != {value_output!r}')
+    return EXIT_DIFFERENT
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,34 @@
+"""
+Compare float32 and bfloat16 autocast training on CPU: epoch time and final validation L1 loss on the same split.
+"""
+
+import time
+import tempfile
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from dataset import build_datasets, build_dataloaders
+from model import ChessNetRegression
+from runner import Runner
+
+def train_and_validate(amp_dtype, dataloaders, epochs=3):
+    train_dataloader, val_dataloader, _ = dataloaders
+    torch.manual_seed(0)
+    with tempfile.TemporaryDirectory() as work_dir:
+        runner = Runner(runner_type='REG', work_dir=work_dir,
+                        model=ChessNetRegression(num_hidden_layers=3, use_reduction=True),
+                        criterion=nn.L1Loss(), optimizer=optim.Adam, lr=0.001, amp_dtype=amp_dtype)
+        start_time = time.time()
+        runner.train(train_loader=train_dataloader, epochs=epochs, log_interval=0)
+        epoch_time = (time.time() - start_time) / epochs
+        val_losses, _, _ = runner.test(val_dataloader, collect=False)
+    return epoch_time, float(np.mean(val_losses))
+
+if __name__ == '__main__':
+    dataloaders = build_dataloaders(build_datasets(), batch_size=256)
+    results = {name: train_and_validate(amp_dtype, dataloaders) for name, amp_dtype in [('float32', None), ('bfloat16', torch.bfloat16)]}
+    for name, (epoch_time, val_loss) in results.items():
+        print(f'[{name:>8}] epoch time: {epoch_time:.2f}s, val L1 loss: {val_loss:.4f}')
+    print(f'[speedup] {results["float32"][0] / results["bfloat16"][0]:.2f}x, '
+          f'[val loss difference] {results["bfloat16"][1] - results["float32"][1]:+.4f}')
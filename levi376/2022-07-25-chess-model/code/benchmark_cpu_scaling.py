@@ -0,0 +1,21 @@
+"""
+Report training samples/sec of train_cpu.py at 1, 2, 4 and 8 DDP worker processes.
+"""
+
+import os
+import tempfile
+import torch.nn as nn
+import torch.optim as optim
+from train_cpu import train_ddp_cpu
+
+if __name__ == '__main__':
+    max_train_samples = 200000
+    batch_size = 256
+    model_kwargs = dict(num_hidden_layers=3, use_reduction=True)
+    for port, world_size in enumerate([1, 2, 4, 8], start=29500):
+        with tempfile.TemporaryDirectory() as work_dir:
+            runner_kwargs = dict(runner_type='REG', work_dir=work_dir, criterion=nn.L1Loss(), optimizer=optim.Adam, lr=0.001)
+            result = train_ddp_cpu(world_size, runner_kwargs, model_kwargs, batch_size=batch_size, epochs=1, log_interval=0,
+                                   threads_per_worker=max(1, os.cpu_count() // world_size),
+                                   max_train_samples=max_train_samples, validate=False, port=port)
+        print(f'[workers={world_size}] {result["samples"] / result["seconds"]:.0f} samples/s')
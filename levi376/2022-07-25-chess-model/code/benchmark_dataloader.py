@@ -0,0 +1,28 @@
+"""
+Compare batches/sec of per-item DataLoader against batched ChessBatchSampler loader.
+"""
+
+import time
+from torch.utils.data import DataLoader
+from dataset import build_datasets, batch_dataloader
+
+def batches_per_second(dataloader, max_batches=2000):
+    start_time = time.time()
+    num_batches = 0
+    for inputs, y_true in dataloader:
+        num_batches += 1
+        if num_batches >= max_batches:
+            break
+    return num_batches / (time.time() - start_time)
+
+if __name__ == '__main__':
+    train_dataset, _, _ = build_datasets()
+    for batch_size in [64, 256, 1024]:
+        for shuffle in [False, True]:
+            item_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=shuffle)
+            batch_loader = batch_dataloader(train_dataset, batch_size=batch_size, shuffle=shuffle)
+            item_speed = batches_per_second(item_loader)
+            batch_speed = batches_per_second(batch_loader)
+            print(f'[batch_size={batch_size:>4}][shuffle={shuffle!s:>5}] '
+                  f'per-item: {item_speed:8.1f} batches/s, batched: {batch_speed:8.1f} batches/s, '
+                  f'speedup: {batch_speed / item_speed:.1f}x')
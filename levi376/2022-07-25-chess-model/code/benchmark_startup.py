@@ -0,0 +1,30 @@
+"""
+Measure startup time of each module in a fresh interpreter and check which data files it opens.
+Inference-only entry points (model, bitpack) must not touch data.npz.
+"""
+
+import sys
+import json
+import subprocess
+
+PROBE = '''
+import sys, json, time
+opened = []
+sys.addaudithook(lambda event, args: event == 'open' and str(args[0]).endswith(('.npz', '.npy')) and opened.append(str(args[0])))
+start_time = time.perf_counter()
+import {module}
+print(json.dumps({{'seconds': time.perf_counter() - start_time, 'opened': opened}}))
+'''
+
+def measure_import(module):
+    output = subprocess.run([sys.executable, '-c', PROBE.format(module=module)], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+if __name__ == '__main__':
+    # torch itself is the baseline every module pays for
+    baseline = measure_import('torch')['seconds']
+    print(f'[   torch] import: {baseline * 1000:8.1f} ms')
+    for module in ['bitpack', 'model', 'dataset', 'runner']:
+        result = measure_import(module)
+        print(f'[{module:>8}] import: {result["seconds"] * 1000:8.1f} ms ({(result["seconds"] - baseline) * 1000:+.1f} ms over torch), '
+              f'data files opened: {result["opened"] or "none"}')
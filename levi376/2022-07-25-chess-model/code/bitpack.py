@@ -0,0 +1,44 @@
+"""
+Bit-packed storage of the 770 binary chess features, 97 bytes per position instead of 770.
+"""
+
+import numpy as np
+import torch
+
+NUM_FEATURES = 770
+PACKED_SIZE = (NUM_FEATURES + 7) // 8
+# most significant bit first, same bit order as np.packbits
+BIT_SHIFTS = torch.arange(7, -1, -1, dtype=torch.uint8)
+
+"""Pack / unpack numpy arrays"""
+
+def pack_features(X):
+    return np.packbits(np.asarray(X, np.uint8), axis=-1)
+
+def unpack_features(packed, dtype=np.int8):
+    return np.unpackbits(np.asarray(packed, np.uint8), axis=-1, count=NUM_FEATURES).astype(dtype, copy=False)
+
+def is_packed(X):
+    return X.dtype == np.uint8 and X.shape[-1] == PACKED_SIZE
+
+"""Unpack a single row or a whole batch of packed rows straight to float32 tensor"""
+
+def unpack_to_tensor(packed, dtype=torch.float32):
+    packed = torch.as_tensor(packed, dtype=torch.uint8)
+    bits = (packed.unsqueeze(-1) >> BIT_SHIFTS.to(packed.device)) & 1
+    return bits.flatten(-2)[..., :NUM_FEATURES].to(dtype)
+
+if __name__ == '__main__':
+    # round-trip check against current int8 format
+    rng = np.random.default_rng(0)
+    X = rng.integers(0, 2, size=(1000, NUM_FEATURES), dtype=np.int8)
+    X[0] = 0
+    X[1] = 1
+    packed = pack_features(X)
+    print('[X]', X.shape, X.dtype, X.nbytes)
+    print('[packed]', packed.shape, packed.dtype, packed.nbytes)
+    assert packed.shape == (len(X), PACKED_SIZE) and is_packed(packed)
+    assert np.array_equal(unpack_features(packed), X)
+    assert torch.equal(unpack_to_tensor(packed), torch.tensor(X, dtype=torch.float32))
+    assert torch.equal(unpack_to_tensor(packed[5]), torch.tensor(X[5], dtype=torch.float32))
+    print('round-trip ok')
@@ -0,0 +1,109 @@
+"""
+Asynchronous checkpoint writer for Runner.train.
+State is snapshotted on the training thread and written atomically on a background thread,
+keeping the last N checkpoints plus the best one by validation loss.
+"""
+
+import os
+import glob
+import queue
+import threading
+import torch
+
+"""Copy all tensors of a (nested) state dict to cpu, so training can continue while it is written"""
+
+def snapshot(state):
+    if isinstance(state, torch.Tensor):
+        return state.detach().to('cpu', copy=True)
+    if isinstance(state, dict):
+        return {key: snapshot(value) for key, value in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(snapshot(value) for value in state)
+    return state
+
+"""Write to temporary file in same directory, then rename, so a crash never leaves a torn checkpoint"""
+
+def atomic_save(obj, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as outfile:
+        torch.save(obj, outfile)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    os.replace(tmp_path, path)
+
+"""Checkpoints of a run, oldest first; epoch and batch are zero padded so sorted names are in training order"""
+
+def list_checkpoints(models_dir, name):
+    return sorted(glob.glob(os.path.join(models_dir, f'{name}-epoch*-batch*.ckpt')))
+
+"""# Checkpoint Writer"""
+
+class CheckpointWriter:
+    def __init__(self, models_dir, name='ChessNet', keep_last=3, weights_path=None):
+        """Writes `{name}-epoch0001-batch0000000.ckpt`, ... and `{name}-best.ckpt` into models_dir.
+        If weights_path is given, plain model state_dict is also written there (the format test.py loads)."""
+        self.models_dir = models_dir
+        self.name = name
+        self.keep_last = keep_last
+        self.weights_path = weights_path
+        self.best_loss = None
+        self.error = None
+        # at most two snapshots wait in memory, save() blocks only if disk is slower than two epochs
+        self.queue = queue.Queue(maxsize=2)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def checkpoint_path(self, epoch, batch=0):
+        # position where training continues: epoch index and next batch in it
+        return os.path.join(self.models_dir, f'{self.name}-epoch{epoch:04d}-batch{batch:07d}.ckpt')
+
+    def best_path(self):
+        return os.path.join(self.models_dir, f'{self.name}-best.ckpt')
+
+    def save(self, state, epoch, val_loss=None, batch=0):
+        """Snapshots `state` (dict with 'model', 'optimizer', 'scheduler', ...) and queues it for writing.
+        `epoch` and `batch` are the position where resumed training continues."""
+        self.raise_error()
+        is_best = val_loss is not None and (self.best_loss is None or val_loss < self.best_loss)
+        if is_best:
+            self.best_loss = val_loss
+        state = snapshot(dict(state, epoch=epoch, batch=batch, val_loss=val_loss))
+        self.queue.put((state, self.checkpoint_path(epoch, batch), is_best))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                state, path, is_best = item
+                atomic_save(state, path)
+                if is_best:
+                    atomic_save(state, self.best_path())
+                if self.weights_path:
+                    atomic_save(state['model'], self.weights_path)
+                self.rotate()
+                print('saved checkpoint at', path, '(best)' if is_best else '')
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def rotate(self):
+        for path in list_checkpoints(self.models_dir, self.name)[:-self.keep_last] if self.keep_last > 0 else []:
+            os.remove(path)
+
+    def wait(self):
+        """Blocks until all queued checkpoints are written."""
+        self.queue.join()
+        self.raise_error()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.raise_error()
+
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError('writing checkpoint failed') from error
@@ -4,31 +4,225 @@ https://colab.research.google.com/drive/1d9oBD1JE3hI3TeIYlYJIycrsxOL6Tljs
 """
 
 import os
+import re
+import json
+import time
+import struct
 import numpy as np
+from bitpack import pack_features, PACKED_SIZE
+from concurrent.futures import ProcessPoolExecutor
 
-"""This function converts text dataset to compressed numpy array format for fast use in the future."""
+NUM_FEATURES = 770
+SCORE_RANGE = (-9000, 9000)
+CHUNK_SIZE = 100000
+
+# matches label part of a line, e.g. 'PovScore(Cp(+1667), WHITE)', 'PovScore(Mate(-3), BLACK)', 'PovScore(MateGiven, WHITE)'
+SCORE_PATTERN = re.compile(rb'PovScore\((?:(Cp|Mate)\(([+-]?\d+)\)|(MateGiven)), (WHITE|BLACK)\)')
+
+"""Parse label of one line without eval"""
+
+def parse_score(text, white_pov=False, mate_score=None):
+    """Returns centipawn score of `text` or None if it can not be used as label.
+    Score is relative to the side given in PovScore unless `white_pov` is True.
+    Mate scores are skipped unless `mate_score` is given, then Mate(+n) becomes mate_score - n."""
+    match = SCORE_PATTERN.fullmatch(text.strip())
+    if match is None:
+        return None
+    kind, value, mate_given, pov = match.groups()
+    if kind == b'Cp':
+        score = int(value)
+    elif mate_score is None:
+        return None
+    elif mate_given:
+        score = mate_score
+    else:
+        moves = int(value)
+        score = mate_score - moves if moves > 0 else -mate_score - moves
+    if white_pov and pov == b'BLACK':
+        score = -score
+    return score
+
+"""Write numpy arrays to .npy file one chunk at a time"""
+
+class NpyWriter:
+    HEADER_LEN = 128
+
+    def __init__(self, path, dtype, row_shape=()):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.num_rows = 0
+        self.file = open(path, 'wb')
+        self.write_header()
+
+    def write_header(self):
+        # header has fixed length so it can be rewritten once final number of rows is known
+        shape = (self.num_rows,) + self.row_shape
+        header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (np.lib.format.dtype_to_descr(self.dtype), shape)
+        header = header.ljust(self.HEADER_LEN - 11) + '\n'
+        self.file.seek(0)
+        self.file.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1'))
+
+    def write(self, array):
+        array = np.ascontiguousarray(array, dtype=self.dtype)
+        assert array.shape[1:] == self.row_shape
+        self.file.write(array.tobytes())
+        self.num_rows += len(array)
+
+    def close(self):
+        self.write_header()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+"""Parse text dataset in fixed size chunks, memory usage depends on chunk_size only"""
+
+def iter_text_chunks(infile, chunk_size=CHUNK_SIZE, score_range=SCORE_RANGE, white_pov=False, mate_score=None):
+    """Yields (X, y) chunks of at most `chunk_size` rows from binary file object `infile`."""
+    X_buffer = np.empty((chunk_size, NUM_FEATURES), np.int8)
+    y_buffer = np.empty(chunk_size, np.int32)
+    features = []
 
-def convert_text_to_npz(text_path, npz_path):
-    with open(text_path) as infile:
-        print('processing', text_path)
-        X = []
-        y = []
-        
-        for i, line in enumerate(infile):
-            line = line.strip()
-            if len(line) > 0:
-                _x = eval(line[line.index('['):])
-                _y = eval(line[:line.index('[')-1])
-                if -9000 <= _y <= 9000:
-                    X.append(_x)
-                    y.append(_y)
-        
-        X = np.array(X, np.int8)
-        y = np.array(y, np.int32)
-        print('[X]', X.shape, X)
-        print('[y]', y.shape, y)
+    def parse_features():
+        # all features are single digits, so the digits of whole chunk are parsed with one vectorized call
+        digits = np.frombuffer(b''.join(features), np.uint8)
+        digits = digits[digits >= ord('0')] - ord('0')
+        n = len(features)
+        if digits.size != n * NUM_FEATURES:
+            raise ValueError(f'expected {NUM_FEATURES} single digit features in every line')
+        X_buffer[:n] = digits.reshape(n, NUM_FEATURES)
+        features.clear()
+        return n
+
+    for line in infile:
+        start = line.find(b'[')
+        if start < 0:
+            continue
+        score = parse_score(line[:start], white_pov, mate_score)
+        if score is None or not (score_range[0] <= score <= score_range[1]):
+            continue
+        y_buffer[len(features)] = score
+        features.append(line[start + 1:line.rindex(b']')])
+        if len(features) == chunk_size:
+            n = parse_features()
+            yield X_buffer[:n], y_buffer[:n]
+
+    if features:
+        n = parse_features()
+        yield X_buffer[:n], y_buffer[:n]
+
+"""This function converts lines of text dataset to uncompressed numpy files, X and y are written chunk by chunk."""
+
+def convert_lines_to_npy(lines, X_path, y_path, chunk_size=CHUNK_SIZE, tag='[rows]', packed=False, **parse_kwargs):
+    # packed=True stores X as np.packbits of the features, 97 uint8 bytes per position
+    start_time = time.time()
+    y_min, y_max = None, None
+    X_dtype, X_row_shape = (np.uint8, (PACKED_SIZE,)) if packed else (np.int8, (NUM_FEATURES,))
+    with NpyWriter(X_path, X_dtype, X_row_shape) as X_writer, NpyWriter(y_path, np.int32) as y_writer:
+        for X, y in iter_text_chunks(lines, chunk_size, **parse_kwargs):
+            X_writer.write(pack_features(X) if packed else X)
+            y_writer.write(y)
+            y_min = int(y.min()) if y_min is None else min(y_min, int(y.min()))
+            y_max = int(y.max()) if y_max is None else max(y_max, int(y.max()))
+            elapsed = time.time() - start_time
+            print(f'{tag} {y_writer.num_rows} ({y_writer.num_rows / max(elapsed, 1e-9):.0f} rows/s)')
+    return {'rows': y_writer.num_rows, 'y_min': y_min, 'y_max': y_max, 'seconds': time.time() - start_time}
+
+def convert_text_to_npy(text_path, X_path, y_path, chunk_size=CHUNK_SIZE, **parse_kwargs):
+    print('processing', text_path)
+    with open(text_path, 'rb') as infile:
+        stats = convert_lines_to_npy(infile, X_path, y_path, chunk_size, **parse_kwargs)
+    print('saved files', X_path, y_path, 'rows:', stats['rows'], f'time: {stats["seconds"]:.2f}s')
+    return stats['rows']
+
+"""Split text dataset in byte ranges aligned to line boundaries and convert every range to its own shard in parallel"""
+
+def find_line_ranges(text_path, num_parts):
+    size = os.path.getsize(text_path)
+    offsets = [0]
+    with open(text_path, 'rb') as infile:
+        for k in range(1, num_parts):
+            infile.seek(max(k * size // num_parts, offsets[-1]))
+            if infile.tell() > 0:
+                # move to the start of next line
+                infile.seek(infile.tell() - 1)
+                infile.readline()
+            offsets.append(min(infile.tell(), size))
+    offsets.append(size)
+    return [(start, end) for start, end in zip(offsets[:-1], offsets[1:]) if start < end]
+
+def read_line_range(infile, start, end):
+    infile.seek(start)
+    position = start
+    for line in infile:
+        if position >= end:
+            break
+        position += len(line)
+        yield line
+
+def convert_range_to_npy(text_path, start, end, X_path, y_path, chunk_size=CHUNK_SIZE, **parse_kwargs):
+    tag = f'[{os.path.basename(X_path)}]'
+    with open(text_path, 'rb') as infile:
+        stats = convert_lines_to_npy(read_line_range(infile, start, end), X_path, y_path, chunk_size, tag, **parse_kwargs)
+    stats['byte_range'] = [start, end]
+    return stats
+
+def convert_text_to_shards(text_path, out_dir, num_workers=None, num_shards=None, chunk_size=CHUNK_SIZE, packed=False, **parse_kwargs):
+    """Writes shards `data-00000.X.npy`, `data-00000.y.npy`, ... and `manifest.json` into `out_dir`, returns manifest path."""
+    num_workers = num_workers or os.cpu_count()
+    num_shards = num_shards or num_workers
+    os.makedirs(out_dir, exist_ok=True)
+    print('processing', text_path, 'with', num_workers, 'workers')
+    start_time = time.time()
+
+    ranges = find_line_ranges(text_path, num_shards)
+    names = [f'data-{k:05d}' for k in range(len(ranges))]
+    with ProcessPoolExecutor(num_workers) as executor:
+        futures = [executor.submit(convert_range_to_npy, text_path, start, end,
+                                   os.path.join(out_dir, name + '.X.npy'), os.path.join(out_dir, name + '.y.npy'),
+                                   chunk_size, packed=packed, **parse_kwargs)
+                   for name, (start, end) in zip(names, ranges)]
+        shards = [dict(X=name + '.X.npy', y=name + '.y.npy', **future.result()) for name, future in zip(names, futures)]
+
+    manifest = {
+        'source': os.path.basename(text_path),
+        'num_features': NUM_FEATURES,
+        'packed': packed,
+        'total_rows': sum(shard['rows'] for shard in shards),
+        'shards': shards,
+    }
+    manifest_path = os.path.join(out_dir, 'manifest.json')
+    with open(manifest_path, 'w') as outfile:
+        json.dump(manifest, outfile, indent=2)
+    elapsed = time.time() - start_time
+    print('saved', len(shards), 'shards in', out_dir, 'rows:', manifest['total_rows'],
+          f'time: {elapsed:.2f}s ({manifest["total_rows"] / max(elapsed, 1e-9):.0f} rows/s)')
+    return manifest_path
+
+"""This function converts text dataset to compressed numpy array format for fast use in the future."""
 
+def convert_text_to_npz(text_path, npz_path, chunk_size=CHUNK_SIZE, **parse_kwargs):
+    # stream into temporary .npy files, then compress them from memory mapped arrays
+    X_path, y_path = npz_path + '.X.npy', npz_path + '.y.npy'
+    convert_text_to_npy(text_path, X_path, y_path, chunk_size, **parse_kwargs)
+    X = np.load(X_path, mmap_mode='r')
+    y = np.load(y_path, mmap_mode='r')
+    print('[X]', X.shape, X.dtype)
+    print('[y]', y.shape, y.dtype)
     np.savez_compressed(npz_path, X=X, y=y)
-    print('saved file', text_path)
+    del X, y
+    os.remove(X_path)
+    os.remove(y_path)
+    print('saved file', npz_path)
 
-convert_text_to_npz('data.txt', 'data.npz')
+if __name__ == '__main__':
+    convert_text_to_npz('data.txt', 'data.npz')
+    # uncompressed alternative which dataset.py can memory map, load_data('data', mmap=True)
+    # os.makedirs('data', exist_ok=True)
+    # convert_text_to_npy('data.txt', 'data/X.npy', 'data/y.npy')
+    # multi-process alternative, writes numbered shards and manifest.json which dataset.py can load directly
+    # convert_text_to_shards('data.txt', 'data-shards', num_workers=os.cpu_count())
@@ -3,12 +3,13 @@ Original file is located at
 https://colab.research.google.com/drive/1d9oBD1JE3hI3TeIYlYJIycrsxOL6Tljs
 """
 
+import os
+import json
 import numpy as np
-# machine learning libraries
-from sklearn.model_selection import train_test_split
 # deep learning libraries
 import torch
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, Sampler
+from bitpack import is_packed, unpack_to_tensor
 
 # this variable will help using gpu if it's available
 device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
@@ -17,45 +18,153 @@ device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
 """Define new class for Chess dataset"""
 
 class ChessDataset(Dataset):
-    def __init__(self, X, y, debug=False):
+    """X and y are only referenced, so they can be memory mapped arrays larger than RAM.
+    `indices` selects the split of X and y which belongs to this dataset, None means all rows."""
+    def __init__(self, X, y, indices=None, debug=False):
         self.debug = debug
-        self.X = torch.tensor(X)
-        self.y = torch.tensor(y, dtype=torch.int64)
+        # bit-packed X (see bitpack.py) is kept packed and unpacked to float32 on access
+        self.packed = is_packed(X)
+        self.X = X
+        self.y = y
+        self.indices = np.arange(len(y)) if indices is None else np.asarray(indices)
     
     def __len__(self):
-        return len(self.X)
+        return len(self.indices)
 
     def __getitem__(self, idx):
-        return self.X[idx], self.y[idx]
-
-# Load chess dataset from numpy file
-npz_path = 'data.npz'
-data = np.load(npz_path)
-X = data['X']
-y = data['y']
-# print('[X]', X.shape, X.dtype)
-# print('[y]', y.shape, y.dtype)
-
-# split dataset into train/val/test sets with ratios 0.8/0.1/0.1 (approximately).
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.1, random_state=0)
-X_train, X_val, y_train, y_val = train_test_split(X_train, y_train, test_size=0.1, random_state=0)
-
-# create ChessDataset instances for train/val/test sets
-train_dataset = ChessDataset(X_train, y_train)
-val_dataset = ChessDataset(X_val, y_val)
-test_dataset = ChessDataset(X_test, y_test)
-
-# create DataLoader instances for train/val/test sets
+        # idx can also be an array of positions, then a whole batch is returned with one fancy-index slice
+        row = self.indices[idx]
+        x = torch.from_numpy(np.array(self.X[row]))
+        y = torch.tensor(self.y[row], dtype=torch.int64)
+        if self.packed:
+            return unpack_to_tensor(x), y
+        return x, y
+
+"""Batch sampler which yields arrays of positions, one per batch.
+Used with DataLoader(batch_size=None) so ChessDataset.__getitem__ is called once per batch and nothing is collated."""
+
+class ChessBatchSampler(Sampler):
+    """Shuffle order depends only on seed and epoch, so it can be replayed when resuming training.
+    set_epoch selects the epoch (it advances by itself after every full pass), set_start_batch skips
+    already trained batches in the next pass."""
+    def __init__(self, num_rows, batch_size=64, shuffle=False, drop_last=False, seed=0):
+        self.num_rows = num_rows
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+        self.start_batch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def set_start_batch(self, start_batch):
+        self.start_batch = start_batch
+
+    def __len__(self):
+        if self.drop_last:
+            return self.num_rows // self.batch_size
+        return (self.num_rows + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        if self.shuffle:
+            generator = torch.Generator().manual_seed(self.seed + self.epoch)
+            order = torch.randperm(self.num_rows, generator=generator).numpy()
+        else:
+            order = np.arange(self.num_rows)
+        start_batch, self.start_batch = self.start_batch, 0
+        for i in range(start_batch, len(self)):
+            yield order[i * self.batch_size:(i + 1) * self.batch_size]
+        self.epoch += 1
+
+def batch_dataloader(dataset, batch_size=64, shuffle=False, drop_last=False, seed=0, **kwargs):
+    sampler = ChessBatchSampler(len(dataset), batch_size, shuffle, drop_last, seed)
+    # own generator, otherwise every new DataLoader iterator draws its base seed from the global torch RNG
+    # and a resumed run would see different dropout masks than the original one
+    kwargs.setdefault('generator', torch.Generator().manual_seed(seed))
+    return DataLoader(dataset, sampler=sampler, batch_size=None, **kwargs)
+
+"""Read-only view over rows of several memory mapped shards, indexed like one array"""
+
+class ShardedArray:
+    def __init__(self, shards):
+        self.shards = shards
+        self.offsets = np.cumsum([0] + [len(shard) for shard in shards])
+        self.shape = (int(self.offsets[-1]),) + shards[0].shape[1:]
+        self.dtype = shards[0].dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, idx):
+        if np.isscalar(idx):
+            k = np.searchsorted(self.offsets, idx, side='right') - 1
+            return self.shards[k][idx - self.offsets[k]]
+        idx = np.asarray(idx)
+        out = np.empty(idx.shape + self.shape[1:], self.dtype)
+        shard_ids = np.searchsorted(self.offsets, idx, side='right') - 1
+        for k in np.unique(shard_ids):
+            mask = shard_ids == k
+            out[mask] = self.shards[k][idx[mask] - self.offsets[k]]
+        return out
+
+"""Load chess dataset from .npz file, from directory with uncompressed X.npy and y.npy (see convert_text_to_npy)
+or from manifest.json of shards written by convert_text_to_shards.
+Uncompressed files are opened with mmap_mode='r' when mmap is True, so nothing is read before it is used."""
+
+def load_data(path, mmap=False):
+    mmap_mode = 'r' if mmap else None
+    if path.endswith('.json'):
+        with open(path) as infile:
+            manifest = json.load(infile)
+        shards_dir = os.path.dirname(path)
+        X_shards = [np.load(os.path.join(shards_dir, shard['X']), mmap_mode=mmap_mode) for shard in manifest['shards']]
+        y_shards = [np.load(os.path.join(shards_dir, shard['y']), mmap_mode=mmap_mode) for shard in manifest['shards']]
+        if mmap:
+            return ShardedArray(X_shards), ShardedArray(y_shards)
+        return np.concatenate(X_shards), np.concatenate(y_shards)
+    if os.path.isdir(path):
+        return np.load(os.path.join(path, 'X.npy'), mmap_mode=mmap_mode), np.load(os.path.join(path, 'y.npy'), mmap_mode=mmap_mode)
+    data = np.load(path)
+    return data['X'], data['y']
+
+"""Split dataset into train/val/test index arrays with ratios 0.8/0.1/0.1 (approximately).
+Gives the same rows as calling train_test_split on X and y, without copying them."""
+
+def split_indices(num_rows, test_size=0.1, val_size=0.1, random_state=0):
+    # machine learning libraries, imported here because only training needs them
+    from sklearn.model_selection import train_test_split
+    train_idx, test_idx = train_test_split(np.arange(num_rows), test_size=test_size, random_state=random_state)
+    train_idx, val_idx = train_test_split(train_idx, test_size=val_size, random_state=random_state)
+    return train_idx, val_idx, test_idx
+
+"""Build datasets and dataloaders on demand, importing this module does not touch the data files"""
+
+NPZ_PATH = 'data.npz'
 BATCH_SIZE = 64
-train_dataloader = DataLoader(train_dataset, batch_size=BATCH_SIZE)
-val_dataloader = DataLoader(val_dataset, batch_size=BATCH_SIZE)
-test_dataloader = DataLoader(test_dataset, batch_size=BATCH_SIZE)
+
+def build_datasets(data_path=NPZ_PATH, mmap=False):
+    """Returns train/val/test ChessDataset instances which share the same X and y.
+    Use data_path='data' with mmap=True for uncompressed files larger than RAM, see convert_text_to_npy."""
+    X, y = load_data(data_path, mmap)
+    train_idx, val_idx, test_idx = split_indices(len(y))
+    return ChessDataset(X, y, train_idx), ChessDataset(X, y, val_idx), ChessDataset(X, y, test_idx)
+
+def build_dataloaders(datasets, batch_size=BATCH_SIZE, shuffle_train=False, **kwargs):
+    train_dataset, val_dataset, test_dataset = datasets
+    train_dataloader = batch_dataloader(train_dataset, batch_size=batch_size, shuffle=shuffle_train, **kwargs)
+    val_dataloader = batch_dataloader(val_dataset, batch_size=batch_size, **kwargs)
+    test_dataloader = batch_dataloader(test_dataset, batch_size=batch_size, **kwargs)
+    return train_dataloader, val_dataloader, test_dataloader
 
 if __name__ == '__main__':
-    print('[X_train, y_train]', X_train.shape, y_train.shape)
-    print('[X_val, y_val]', X_val.shape, y_val.shape)
-    print('[X_test, y_test]', X_test.shape, y_test.shape)
-    print(len(X_train) + len(X_val) + len(X_test), len(X))
+    train_dataset, val_dataset, test_dataset = build_datasets()
+    train_dataloader, val_dataloader, test_dataloader = build_dataloaders((train_dataset, val_dataset, test_dataset))
+    print('[train_idx]', train_dataset.indices.shape)
+    print('[val_idx]', val_dataset.indices.shape)
+    print('[test_idx]', test_dataset.indices.shape)
+    print(len(train_dataset) + len(val_dataset) + len(test_dataset), len(train_dataset.y))
 
     print('[train_dataset]', len(train_dataset))
     print('[val_dataset]', len(val_dataset))
@@ -3,36 +3,84 @@ Original file is located at
 https://colab.research.google.com/drive/1d9oBD1JE3hI3TeIYlYJIycrsxOL6Tljs
 """
 
+import time
 import numpy as np
 import matplotlib.pyplot as plt
+from dataset import load_data, ShardedArray
+
+CHUNK_SIZE = 10000000
+
+"""Iterate array in chunks, memory mapped arrays and shards are read one chunk at a time"""
+
+def iter_chunks(array, chunk_size=CHUNK_SIZE):
+    if isinstance(array, ShardedArray):
+        for shard in array.shards:
+            yield from iter_chunks(shard, chunk_size)
+        return
+    for start in range(0, len(array), chunk_size):
+        yield np.asarray(array[start:start + chunk_size])
 
 """# Data Analysis
 
-Load dataset as numpy array
+Count of every y value in a single pass with np.bincount, y values are shifted by y_min so they start at 0
 """
-npz_path = 'data.npz'
-data = np.load(npz_path)
-X = data['X']
-y = data['y']
-print('[X]', X.dtype, X.shape, X.min(), X.max())
-print('[y]', y.dtype, y.shape, y.min(), y.max())
-print('[unique y values]', len(np.unique(y)))
-
-"""Get count of each unique y value"""
-
-y_counts = {}
-y_unique = np.unique(y)
-for val in y_unique:
-    count = len(np.where(y == val)[0])
-    y_counts[val] = count
-# print(y_counts)
-print(min(y_counts.values()), max(y_counts.values()))
-
-"""Frequency plot of y values"""
-
-plt.figure(figsize=(25, 5))
-plt.hist(y, width=1, bins=18000)
-plt.xlim([-9100, 9100])
-plt.savefig('plot.jpg', dpi=150)
-print('plot saved')
-# plt.show()
+
+def label_counts(y, y_min=-9000, y_max=9000, chunk_size=CHUNK_SIZE):
+    counts = np.zeros(y_max - y_min + 1, np.int64)
+    for chunk in iter_chunks(y, chunk_size):
+        if chunk.size and (chunk.min() < y_min or chunk.max() > y_max):
+            raise ValueError(f'y values outside of [{y_min}, {y_max}]')
+        counts += np.bincount(chunk.astype(np.int64) - y_min, minlength=len(counts))
+    return counts
+
+def label_summary(counts, y_min=-9000):
+    values = np.arange(len(counts)) + y_min
+    total = counts.sum()
+    present = counts > 0
+    mean = (values * counts).sum() / total
+    std = np.sqrt((((values - mean) ** 2) * counts).sum() / total)
+    return {
+        'count': int(total),
+        'min': int(values[present][0]),
+        'max': int(values[present][-1]),
+        'mean': float(mean),
+        'std': float(std),
+        'unique': int(present.sum()),
+        'min_count': int(counts[present].min()),
+        'max_count': int(counts[present].max()),
+    }
+
+def feature_range(X, chunk_size=CHUNK_SIZE // 770):
+    X_min, X_max = None, None
+    for chunk in iter_chunks(X, chunk_size):
+        X_min = chunk.min() if X_min is None else min(X_min, chunk.min())
+        X_max = chunk.max() if X_max is None else max(X_max, chunk.max())
+    return X_min, X_max
+
+"""Frequency plot of y values, drawn from precomputed counts instead of raw array"""
+
+def plot_counts(counts, y_min=-9000, path='plot.jpg'):
+    edges = np.arange(len(counts) + 1) + y_min - 0.5
+    plt.figure(figsize=(25, 5))
+    plt.stairs(counts, edges, fill=True)
+    plt.xlim([-9100, 9100])
+    plt.savefig(path, dpi=150)
+    print('plot saved')
+    # plt.show()
+
+if __name__ == '__main__':
+    start_time = time.time()
+    # Load dataset as numpy array, uncompressed files and shards are memory mapped, see dataset.load_data
+    X, y = load_data('data.npz', mmap=True)
+    print('[X]', X.dtype, X.shape, *feature_range(X))
+
+    """Get count of each unique y value"""
+    counts = label_counts(y)
+    summary = label_summary(counts)
+    print('[y]', y.dtype, y.shape, summary['min'], summary['max'])
+    print('[unique y values]', summary['unique'])
+    print(summary['min_count'], summary['max_count'])
+    print('[summary]', summary)
+
+    plot_counts(counts)
+    print(f'time: {time.time() - start_time:.2f}s')
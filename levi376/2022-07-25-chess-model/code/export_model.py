@@ -0,0 +1,109 @@
+"""
+Export ChessNetRegression for CPU serving: TorchScript module, ONNX file and dynamically quantized int8 variant.
+Compares the variants on the test split (MAE against y_test, positions/sec) so the fastest one within an error budget can be picked.
+"""
+
+import os
+import time
+import numpy as np
+
+# deep learning libraries
+import torch
+import torch.nn as nn
+from model import ChessNetRegression
+from bitpack import NUM_FEATURES
+
+"""# Export"""
+
+def export_torchscript(model, path):
+    # traced, ModuleList slicing in forward can not be scripted; the network has no data dependent control flow
+    model = model.eval()
+    scripted = torch.jit.freeze(torch.jit.trace(model, torch.zeros(1, NUM_FEATURES)))
+    scripted.save(path)
+    print('saved TorchScript model at', path)
+    return scripted
+
+def export_onnx(model, path):
+    model = model.eval()
+    torch.onnx.export(model, (torch.zeros(1, NUM_FEATURES),), path, input_names=['x'], output_names=['y'],
+                      dynamic_axes={'x': {0: 'batch'}, 'y': {0: 'batch'}})
+    print('saved ONNX model at', path)
+
+def quantize_int8(model):
+    # weights of nn.Linear are stored as int8, activations are quantized on the fly
+    return torch.ao.quantization.quantize_dynamic(model.eval(), {nn.Linear}, dtype=torch.qint8)
+
+def export_all(model, out_dir, name='ChessNet'):
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {
+        'scripted': os.path.join(out_dir, f'{name}.pt'),
+        'onnx': os.path.join(out_dir, f'{name}.onnx'),
+        'quantized': os.path.join(out_dir, f'{name}-int8.pt'),
+    }
+    variants = {'eager': model.eval(), 'scripted': export_torchscript(model, paths['scripted'])}
+    export_onnx(model, paths['onnx'])
+    variants['quantized'] = export_torchscript(quantize_int8(model), paths['quantized'])
+    return variants, paths
+
+"""# Accuracy vs speed report"""
+
+def evaluate(predict, X, y, batch_size=1024):
+    """Returns MAE against y and positions/sec of `predict`, which maps float32 array batch to predictions."""
+    y_pred = np.empty(len(y), np.float32)
+    start_time = time.time()
+    for start in range(0, len(y), batch_size):
+        y_pred[start:start + batch_size] = predict(X[start:start + batch_size]).ravel()
+    elapsed = time.time() - start_time
+    return float(np.abs(y_pred - y).mean()), len(y) / elapsed
+
+def torch_predictor(model):
+    def predict(x):
+        with torch.inference_mode():
+            return model(torch.from_numpy(x)).numpy()
+    return predict
+
+def onnx_predictor(path):
+    try:
+        import onnxruntime
+    except ImportError:
+        return None
+    session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+    return lambda x: session.run(None, {'x': x})[0]
+
+def speed_report(variants, onnx_path, X_test, y_test, batch_size=1024, error_budget=None):
+    X_test = np.asarray(X_test, np.float32)
+    y_test = np.asarray(y_test, np.float32)
+    predictors = {name: torch_predictor(model) for name, model in variants.items()}
+    predictor = onnx_predictor(onnx_path)
+    if predictor is not None:
+        predictors['onnx'] = predictor
+    else:
+        print('onnxruntime is not installed, skipping ONNX timing')
+
+    rows = []
+    for name, predict in predictors.items():
+        mae, speed = evaluate(predict, X_test, y_test, batch_size)
+        rows.append((name, mae, speed))
+        print(f'[{name:>9}] MAE: {mae:10.4f}, positions/s: {speed:12.0f}')
+    if error_budget is not None:
+        eligible = [row for row in rows if row[1] <= error_budget]
+        if eligible:
+            print('[fastest within error budget]', max(eligible, key=lambda row: row[2])[0])
+        else:
+            print('no model within error budget', error_budget)
+    return rows
+
+if __name__ == '__main__':
+    from dataset import build_datasets
+    from bitpack import unpack_features
+
+    model = ChessNetRegression(3, True)
+    model.load_state_dict(torch.load('regression_model/models/ChessNet-02.pth', map_location='cpu'))
+    variants, paths = export_all(model, 'regression_model/export', 'ChessNet-02')
+
+    _, _, test_dataset = build_datasets()
+    X_test = test_dataset.X[test_dataset.indices]
+    y_test = test_dataset.y[test_dataset.indices]
+    if test_dataset.packed:
+        X_test = unpack_features(X_test)
+    speed_report(variants, paths['onnx'], X_test, y_test, error_budget=None)
@@ -0,0 +1,101 @@
+"""
+Incremental (NNUE-style) evaluation of ChessNetRegression during search.
+The first layer output (accumulator) is kept per position and updated with only the feature columns
+added or removed by a move; only the small upper layers are recomputed for every evaluation.
+"""
+
+import time
+import numpy as np
+import torch
+from model import ChessNetRegression
+from bitpack import NUM_FEATURES
+
+"""Features which are switched on / off between two positions"""
+
+def feature_delta(old_features, new_features):
+    old_features, new_features = np.asarray(old_features), np.asarray(new_features)
+    added = np.flatnonzero((new_features != 0) & (old_features == 0))
+    removed = np.flatnonzero((new_features == 0) & (old_features != 0))
+    return added, removed
+
+"""# Incremental Evaluator"""
+
+class IncrementalEvaluator:
+    def __init__(self, model):
+        layers = [layer for layer in model.nn_layers]
+        # columns of first layer as rows, so a feature update is a row sum
+        # accumulator is kept in float64 so make / unmake never drifts from full recomputation
+        self.W1 = layers[0].weight.detach().cpu().numpy().T.astype(np.float64)
+        self.b1 = layers[0].bias.detach().cpu().numpy().astype(np.float64)
+        # upper layers in eval mode, i.e. without dropout
+        self.upper = [(layer.weight.detach().cpu().numpy().T.copy(), layer.bias.detach().cpu().numpy()) for layer in layers[1:]]
+        self.stack = []
+
+    def reset(self, features):
+        """Computes accumulator of root position from its 770 features."""
+        active = np.flatnonzero(np.asarray(features))
+        self.stack = [self.b1 + self.W1[active].sum(axis=0)]
+
+    def push(self, added, removed):
+        """Make move: updates accumulator with indices of features switched on (added) and off (removed)."""
+        accumulator = self.stack[-1].copy()
+        for idx in added:
+            accumulator += self.W1[idx]
+        for idx in removed:
+            accumulator -= self.W1[idx]
+        self.stack.append(accumulator)
+
+    def pop(self):
+        """Unmake move."""
+        assert len(self.stack) > 1, 'can not pop root position'
+        self.stack.pop()
+
+    def evaluate(self):
+        x = np.maximum(self.stack[-1].astype(np.float32), 0)
+        for i, (W, b) in enumerate(self.upper):
+            x = x @ W + b
+            if i < len(self.upper) - 1:
+                x = np.maximum(x, 0)
+        return float(x[0])
+
+"""# Benchmark against full recomputation"""
+
+def random_walk(num_moves, changes_per_move=4, seed=0):
+    rng = np.random.default_rng(seed)
+    positions = [rng.integers(0, 2, NUM_FEATURES)]
+    for _ in range(num_moves):
+        position = positions[-1].copy()
+        flip = rng.choice(NUM_FEATURES, changes_per_move, replace=False)
+        position[flip] = 1 - position[flip]
+        positions.append(position)
+    return positions
+
+if __name__ == '__main__':
+    model = ChessNetRegression(3, True).eval()
+    # model.load_state_dict(torch.load('regression_model/models/ChessNet-02.pth', map_location='cpu'))
+    positions = random_walk(5000)
+
+    start_time = time.time()
+    with torch.inference_mode():
+        full = [model(torch.tensor(position, dtype=torch.float32).unsqueeze(0)).item() for position in positions]
+    full_speed = len(positions) / (time.time() - start_time)
+
+    evaluator = IncrementalEvaluator(model)
+    start_time = time.time()
+    evaluator.reset(positions[0])
+    incremental = [evaluator.evaluate()]
+    for old, new in zip(positions[:-1], positions[1:]):
+        evaluator.push(*feature_delta(old, new))
+        incremental.append(evaluator.evaluate())
+    incremental_speed = len(positions) / (time.time() - start_time)
+
+    # unmake all moves back to the root position
+    for _ in positions[1:]:
+        evaluator.pop()
+    assert np.isclose(evaluator.evaluate(), incremental[0], rtol=0, atol=1e-6)
+
+    max_error = np.abs(np.array(full) - np.array(incremental)).max()
+    print(f'[full] {full_speed:.0f} evals/s')
+    print(f'[incremental] {incremental_speed:.0f} evals/s ({incremental_speed / full_speed:.1f}x)')
+    print(f'[max abs difference] {max_error:.2e}')
+    assert np.allclose(full, incremental, rtol=1e-5, atol=1e-5)
@@ -0,0 +1,161 @@
+"""
+In-process inference service for ChessNetRegression.
+Concurrent requests from search threads are micro-batched up to max_batch_size or max_latency
+and evaluated with one forward pass per batch.
+"""
+
+import time
+import queue
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future, InvalidStateError
+
+import numpy as np
+import torch
+from bitpack import NUM_FEATURES, is_packed, unpack_features
+from model import ChessNetRegression
+
+# this variable will help using gpu if it's available
+device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+
+"""Load trained model for inference"""
+
+def load_model(weight_path, num_hidden_layers=3, use_reduction=True):
+    model = ChessNetRegression(num_hidden_layers, use_reduction)
+    model.load_state_dict(torch.load(weight_path, map_location=device))
+    return model.to(device).eval()
+
+"""Resolve a request future, a future which was cancelled or already resolved must not stop the serving thread"""
+
+def resolve(future, value=None, error=None):
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+    except InvalidStateError:
+        pass
+
+"""# Inference Server"""
+
+class InferenceServer:
+    def __init__(self, model, max_batch_size=256, max_latency=0.001, stats_window=100000):
+        self.model = model.to(device).eval()
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.requests = queue.Queue()
+        self.latencies = deque(maxlen=stats_window)
+        self.batch_sizes = Counter()
+        self.running = False
+        self.thread = None
+        # submit and stop check / change running under this lock, so no request is queued after stop() drains the queue
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            self.running = True
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        # requests still queued are never evaluated, their callers must not wait forever
+        while True:
+            try:
+                _, future, _ = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            resolve(future, error=RuntimeError('inference server stopped'))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def submit(self, x):
+        """Queues one position (770 features or 97 packed bytes), returns Future of its evaluation."""
+        x = np.asarray(x)
+        if is_packed(x):
+            x = unpack_features(x)
+        assert x.shape == (NUM_FEATURES,), f'expected {NUM_FEATURES} features, got {x.shape}'
+        future = Future()
+        with self.lock:
+            if not self.running:
+                raise RuntimeError('inference server is not running')
+            self.requests.put((x, future, time.perf_counter()))
+        return future
+
+    def evaluate(self, x, timeout=None):
+        return self.submit(x).result(timeout)
+
+    def next_batch(self):
+        try:
+            batch = [self.requests.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        # wait for more requests until batch is full or oldest request has waited max_latency
+        deadline = batch[0][2] + self.max_latency
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def serve(self):
+        while self.running:
+            # requests cancelled by their caller are dropped, the others can no longer be cancelled
+            batch = [request for request in self.next_batch() if request[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            inputs = torch.from_numpy(np.stack([x for x, _, _ in batch])).to(dtype=torch.float32, device=device)
+            try:
+                with torch.inference_mode():
+                    y_pred = self.model(inputs).flatten().cpu().numpy()
+            except Exception as e:
+                for _, future, _ in batch:
+                    resolve(future, error=e)
+                continue
+            now = time.perf_counter()
+            for (_, future, submitted), value in zip(batch, y_pred):
+                resolve(future, float(value))
+                self.latencies.append(now - submitted)
+            self.batch_sizes[len(batch)] += 1
+
+    def stats(self):
+        """Returns p50/p99 latency in milliseconds and histogram of batch sizes."""
+        latencies = np.array(self.latencies) * 1000
+        return {
+            'requests': int(sum(size * count for size, count in self.batch_sizes.items())),
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'batch_sizes': dict(sorted(self.batch_sizes.items())),
+        }
+
+if __name__ == '__main__':
+    # model = load_model('regression_model/models/ChessNet-02.pth')
+    model = ChessNetRegression(3, True)
+    num_threads, evals_per_thread = 32, 200
+    positions = np.random.randint(low=0, high=2, size=(num_threads, NUM_FEATURES))
+
+    def search_thread(k):
+        for _ in range(evals_per_thread):
+            server.evaluate(positions[k])
+
+    with InferenceServer(model, max_batch_size=64, max_latency=0.002) as server:
+        start_time = time.time()
+        threads = [threading.Thread(target=search_thread, args=(k,)) for k in range(num_threads)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        elapsed = time.time() - start_time
+    stats = server.stats()
+    print(f'[evals/s] {stats["requests"] / elapsed:.0f}')
+    print(f'[latency] p50: {stats["p50_ms"]:.3f} ms, p99: {stats["p99_ms"]:.3f} ms')
+    print('[batch sizes]', stats['batch_sizes'])
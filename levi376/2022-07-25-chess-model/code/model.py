@@ -3,7 +3,6 @@ Original file is located at
 https://colab.research.google.com/drive/1d9oBD1JE3hI3TeIYlYJIycrsxOL6Tljs
 """
 
-from dataset import train_dataloader
 import numpy as np
 
 # deep learning libraries
@@ -70,6 +69,8 @@ def get_model_size(model):
     return sum([np.prod(params.shape) for params in model.parameters()])
 
 if __name__ == '__main__':
+    from dataset import build_datasets, build_dataloaders
+    train_dataloader, _, _ = build_dataloaders(build_datasets())
     model_reg = ChessNetRegression(num_hidden_layers=3, debug=True).to(device)
     print(model_reg)
     print('[model_reg]', get_model_size(model_reg))
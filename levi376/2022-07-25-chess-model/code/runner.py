@@ -4,9 +4,13 @@ https://colab.research.google.com/drive/1d9oBD1JE3hI3TeIYlYJIycrsxOL6Tljs
 """
 
 from model import ChessNetRegression
+from checkpoint import CheckpointWriter, list_checkpoints
 
 # general libraries
 import os
+import time
+import random
+import itertools
 import numpy as np
 
 # deep learning libraries
@@ -21,6 +25,75 @@ from torch.utils.tensorboard import SummaryWriter
 device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
 # print('device:', device)
 
+"""# CPU threading"""
+
+def configure_cpu_threads(num_threads=None, num_interop_threads=None):
+    """Sets intra-op and inter-op thread counts of torch, None keeps torch default."""
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            # can only be set once, before any inter-op parallel work has started
+            print('could not set inter-op threads:', e)
+    print('[threads]', torch.get_num_threads(), '[interop threads]', torch.get_num_interop_threads())
+
+"""# Collect batch results
+
+Losses, targets and predictions are written into tensors preallocated on device,
+so there is no device sync or python list per batch.
+"""
+
+class BatchCollector:
+    def __init__(self, num_batches, num_samples, collect=True):
+        self.num_samples = num_samples
+        self.collect = collect
+        self.losses = torch.zeros(num_batches, device=device)
+        self.y_true = None
+        self.y_pred = None
+        self.count = 0
+        # samples of batches seen, counted even when predictions are not collected
+        self.num_seen = 0
+        # range of batch indices seen, a resumed epoch starts after 0
+        self.first_batch = None
+        self.last_batch = -1
+
+    def add(self, i, loss, y_true=None, y_pred=None):
+        if self.first_batch is None:
+            self.first_batch = i
+        self.last_batch = i
+        if y_pred is not None:
+            self.num_seen += len(y_pred)
+        if loss is not None:
+            self.losses[i] = loss.detach()
+        if not self.collect:
+            return
+        if self.y_pred is None:
+            # allocate once shapes and dtypes of first batch are known
+            self.y_true = None if y_true is None else torch.empty((self.num_samples,) + y_true.shape[1:], dtype=y_true.dtype, device=device)
+            y_pred_dtype = torch.float32 if y_pred.is_floating_point() else y_pred.dtype
+            self.y_pred = torch.empty((self.num_samples,) + y_pred.shape[1:], dtype=y_pred_dtype, device=device)
+        n = len(y_pred)
+        if y_pred.is_floating_point():
+            # predictions under autocast are bfloat16 / float16 which numpy can not hold
+            y_pred = y_pred.float()
+        if y_true is not None:
+            self.y_true[self.count:self.count + n] = y_true.detach()
+        self.y_pred[self.count:self.count + n] = y_pred.detach()
+        self.count += n
+
+    def mean_loss(self, start, end):
+        # only place where loss is synced during an epoch
+        return self.losses[max(start, self.first_batch or 0):end].mean().item()
+
+    def result(self):
+        losses = self.losses[self.first_batch or 0:self.last_batch + 1].cpu().numpy()
+        if not self.collect or self.y_pred is None:
+            return losses, None, None
+        y_true = None if self.y_true is None else self.y_true[:self.count].cpu().numpy()
+        return losses, y_true, self.y_pred[:self.count].cpu().numpy()
+
 """# Define Runner"""
 
 class Runner:
@@ -28,76 +101,183 @@ class Runner:
     RUNNER_TYPES = {'CLS': 'CLS', 'REG': 'REG'}
 
     def __init__(self, runner_type='REG', work_dir='', 
-                 model=ChessNetRegression(), 
-                 criterion=nn.CrossEntropyLoss(), 
+                 model=None, 
+                 criterion=None, 
                  optimizer=optim.SGD, lr=0.01, 
-                 save_weight_file='ChessNet.pth', load_weight_file='ChessNet.pth'):
+                 save_weight_file='ChessNet.pth', load_weight_file='ChessNet.pth',
+                 num_threads=None, num_interop_threads=None, rank=0, amp_dtype=None, keep_last_checkpoints=3,
+                 checkpoint_interval=0, resume_from=None):
         assert runner_type in self.RUNNER_TYPES
 
+        if num_threads or num_interop_threads:
+            configure_cpu_threads(num_threads, num_interop_threads)
+
         self.runner_type = runner_type
+        # only rank 0 saves checkpoints when training with DistributedDataParallel, see train_cpu.py
+        self.rank = rank
         self.work_dir = work_dir
         self.models_dir = os.path.join(self.work_dir, 'models')
         self.writer_path = os.path.join(self.work_dir, 'runs')
-        if not os.path.exists(self.work_dir): os.makedirs(self.work_dir)
-        if not os.path.exists(self.models_dir): os.mkdir(self.models_dir)
-        if not os.path.exists(self.writer_path): os.mkdir(self.writer_path)
+        # exist_ok because several DDP processes create the same directories
+        os.makedirs(self.models_dir, exist_ok=True)
+        os.makedirs(self.writer_path, exist_ok=True)
 
-        self.model = model.to(device)
-        self.criterion = criterion
+        # defaults are created here, not at import time
+        self.model = (model if model is not None else ChessNetRegression()).to(device)
+        self.criterion = criterion if criterion is not None else nn.CrossEntropyLoss()
         self.optimizer = optimizer(self.model.parameters(), lr=lr)
         # self.scheduler = lr_scheduler.ExponentialLR(self.optimizer, gamma=0.9)
         self.scheduler = lr_scheduler.StepLR(self.optimizer, step_size=30)
         self.writer = SummaryWriter(self.writer_path)
 
+        # opt-in mixed precision, e.g. amp_dtype=torch.bfloat16 on CPU
+        # float16 needs loss scaling to keep small gradients from underflowing, bfloat16 has float32 range and does not
+        self.amp_dtype = amp_dtype
+        self.scaler = torch.amp.GradScaler(device.type, enabled=amp_dtype == torch.float16)
+
         self.model_save_path = os.path.join(self.models_dir, save_weight_file)
+        self.checkpoint_name = os.path.splitext(save_weight_file)[0]
+        self.keep_last_checkpoints = keep_last_checkpoints
+        # with checkpoint_interval > 0 a checkpoint is also saved every checkpoint_interval training steps
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_writer = None
         self.model_load_path = os.path.join(self.models_dir, load_weight_file)
         if os.path.exists(self.model_load_path):
             self.model.load_state_dict(torch.load(self.model_load_path))
             print('loaded weights from', self.model_load_path)
 
+        # position where train() starts, changed by resuming from a checkpoint
+        self.start_epoch = 0
+        self.start_batch = 0
+        self.total_steps = {'Train': 0, 'Val': 0}
+        self.best_val_loss = None
+        # samples trained in last run_epoch, for samples/s of a resumed epoch
+        self.epoch_samples = 0
+        if resume_from:
+            self.load_checkpoint(resume_from)
+
+    def load_checkpoint(self, path):
+        """Restores full training state from checkpoint written by CheckpointWriter, path='latest' picks newest one of this run."""
+        if path == 'latest':
+            paths = list_checkpoints(self.models_dir, self.checkpoint_name)
+            if not paths:
+                print('no checkpoint to resume from in', self.models_dir)
+                return
+            path = paths[-1]
+        # checkpoint contains numpy and python RNG states, not only tensors
+        # loaded on cpu, torch.set_rng_state only accepts a cpu ByteTensor, load_state_dict moves the rest to the model device
+        state = torch.load(path, map_location='cpu', weights_only=False)
+        self.base_model().load_state_dict(state['model'])
+        self.optimizer.load_state_dict(state['optimizer'])
+        self.scheduler.load_state_dict(state['scheduler'])
+        self.scaler.load_state_dict(state['scaler'])
+        self.total_steps = dict(state['total_steps'])
+        self.best_val_loss = state.get('best_val_loss')
+        self.start_epoch, self.start_batch = state['epoch'], state['batch']
+        torch.set_rng_state(state['rng']['torch'])
+        if torch.cuda.is_available() and state['rng'].get('cuda') is not None:
+            # dropout masks on gpu come from the cuda generators
+            torch.cuda.set_rng_state_all(state['rng']['cuda'])
+        np.random.set_state(state['rng']['numpy'])
+        random.setstate(state['rng']['python'])
+        print('resumed from', path, 'at epoch', self.start_epoch + 1, 'batch', self.start_batch)
+
+    def autocast(self):
+        return torch.autocast(device.type, dtype=self.amp_dtype, enabled=self.amp_dtype is not None)
+
+    def checkpoint_state(self):
+        return {
+            'model': self.base_model().state_dict(),
+            'optimizer': self.optimizer.state_dict(),
+            'scheduler': self.scheduler.state_dict(),
+            'scaler': self.scaler.state_dict(),
+            'total_steps': dict(self.total_steps),
+            'best_val_loss': self.best_val_loss,
+            'rng': {'torch': torch.get_rng_state(), 'numpy': np.random.get_state(), 'python': random.getstate(),
+                    'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None},
+        }
+
+    def base_model(self):
+        # model without DistributedDataParallel wrapper
+        return getattr(self.model, 'module', self.model)
+
     def train(self, train_loader, val_loader=None, epochs=100, log_interval=1000):
         print('Training iterations in one Epoch:', len(train_loader))
         if val_loader:
             print('Validation iterations in one Epoch:', len(val_loader))
 
-        self.total_steps = {'Train': 0, 'Val': 0}
-
-        # loop over the dataset multiple times
-        for epoch in range(epochs):
-
-            # training part
-            self.model.train()
-            train_losses, train_y_true, train_y_pred = self.run_epoch(train_loader, epoch, log_interval, 'Train')
-            # log epoch statistics
-            train_loss = np.mean(train_losses)
-            log_string = f'[Train][{epoch + 1}/{epochs}] '
-            log_string += f'loss: {train_loss:.4f}'
-            print(log_string)
-            self.writer.add_scalar(f'Epoch-Loss/Train', train_loss, epoch)
-
-            # save model checkpoint
-            torch.save(self.model.state_dict(), self.model_save_path)
-            print('saved weights at', self.model_save_path)
-            self.scheduler.step()
-
-            # validation part
-            if val_loader:
-                self.model.eval()
-                with torch.no_grad():
-                    val_losses, val_y_true, val_y_pred = self.run_epoch(val_loader, epoch, log_interval, 'Val')
-                    val_loss = np.mean(val_losses)
-                    log_string = f'[Val][{epoch + 1}/{epochs}] '
-                    log_string += f'loss: {val_loss:.4f}'
-                    print(log_string)
-                    self.writer.add_scalar(f'Epoch-Loss/Val', val_loss, epoch)
-
-    def run_epoch(self, dataloader, epoch, log_interval, run_type='Train'):
-        epoch_losses = []
-        epoch_y_true = []
-        epoch_y_pred = []
+        # checkpoints are written on a background thread, model weights also go to model_save_path
+        self.checkpoint_writer = None
+        if self.rank == 0:
+            self.checkpoint_writer = CheckpointWriter(self.models_dir, self.checkpoint_name, self.keep_last_checkpoints, self.model_save_path)
+            self.checkpoint_writer.best_loss = self.best_val_loss
+
+        try:
+            # loop over the dataset multiple times
+            for epoch in range(self.start_epoch, epochs):
+
+                # training part
+                self.model.train()
+                start_time = time.time()
+                # shuffle order of ChessBatchSampler depends on epoch only, so resumed runs see the same batches
+                if hasattr(train_loader.sampler, 'set_epoch'):
+                    train_loader.sampler.set_epoch(epoch)
+                start_batch, self.start_batch = self.start_batch, 0
+                train_losses, train_y_true, train_y_pred = self.run_epoch(train_loader, epoch, log_interval, 'Train', collect=False, start_batch=start_batch)
+                epoch_time = time.time() - start_time
+                # a resumed epoch only trains the remaining batches
+                samples_per_second = self.epoch_samples / epoch_time
+                # log epoch statistics
+                train_loss = np.mean(train_losses)
+                log_string = f'[Train][{epoch + 1}/{epochs}] '
+                log_string += f'loss: {train_loss:.4f}, time: {epoch_time:.2f}s, samples/s: {samples_per_second:.0f}'
+                print(log_string)
+                self.writer.add_scalar(f'Epoch-Loss/Train', train_loss, epoch)
+                self.writer.add_scalar(f'Epoch-Samples-Per-Second/Train', samples_per_second, epoch)
+
+                self.scheduler.step()
+
+                # validation part
+                val_loss = None
+                if val_loader:
+                    self.model.eval()
+                    with torch.no_grad():
+                        val_losses, val_y_true, val_y_pred = self.run_epoch(val_loader, epoch, log_interval, 'Val', collect=False)
+                        val_loss = np.mean(val_losses)
+                        log_string = f'[Val][{epoch + 1}/{epochs}] '
+                        log_string += f'loss: {val_loss:.4f}'
+                        print(log_string)
+                        self.writer.add_scalar(f'Epoch-Loss/Val', val_loss, epoch)
+
+                # save model checkpoint, resumed training continues with next epoch
+                if val_loss is not None and (self.best_val_loss is None or val_loss < self.best_val_loss):
+                    self.best_val_loss = float(val_loss)
+                self.save_checkpoint(epoch + 1, 0, val_loss)
+        finally:
+            # pending checkpoints are written even if training is interrupted
+            if self.checkpoint_writer is not None:
+                self.checkpoint_writer.close()
+                self.checkpoint_writer = None
+
+    def save_checkpoint(self, epoch, batch, val_loss=None):
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.save(self.checkpoint_state(), epoch, None if val_loss is None else float(val_loss), batch)
+
+    def run_epoch(self, dataloader, epoch, log_interval, run_type='Train', collect=True, start_batch=0):
+        """Returns per-batch losses, y_true and y_pred as numpy arrays, y_true and y_pred are None when collect is False.
+        start_batch > 0 continues an interrupted epoch, earlier batches are skipped."""
+        collector = BatchCollector(len(dataloader), len(dataloader.dataset), collect)
+
+        batches = dataloader
+        if start_batch > 0:
+            if hasattr(dataloader.sampler, 'set_start_batch'):
+                # ChessBatchSampler skips batches without loading them
+                dataloader.sampler.set_start_batch(start_batch)
+            else:
+                batches = itertools.islice(dataloader, start_batch, None)
 
         # iterate over all dataloader, one batch at a time
-        for i, (inputs, y_true) in enumerate(dataloader):
+        for i, (inputs, y_true) in enumerate(batches, start=start_batch):
             # pre-processing
             if self.runner_type == self.RUNNER_TYPES['CLS']:
                 inputs, y_true = inputs.to(dtype=torch.float32, device=device), y_true.to(device=device)
@@ -111,72 +291,77 @@ class Runner:
                 # zero the parameter gradients
                 self.optimizer.zero_grad()
 
-            # forward pass
-            y_pred = self.model(inputs)
-            # calculate loss
-            loss = self.criterion(y_pred, y_true)
+            with self.autocast():
+                # forward pass
+                y_pred = self.model(inputs)
+                # calculate loss
+                loss = self.criterion(y_pred, y_true)
 
             if run_type == 'Train':
                 # backward pass
-                loss.backward()
+                self.scaler.scale(loss).backward()
                 # optimize weights
-                self.optimizer.step()
+                self.scaler.step(self.optimizer)
+                self.scaler.update()
+
+                if self.checkpoint_interval > 0 and (i + 1) % self.checkpoint_interval == 0 and i + 1 < len(dataloader):
+                    # mid-epoch checkpoint, resumed training continues with batch i + 1
+                    self.save_checkpoint(epoch, i + 1)
 
             # post-processing
-            epoch_losses.append(loss.item())
-            epoch_y_true += y_true.tolist()
-            epoch_y_pred += y_pred.tolist()
+            collector.add(i, loss, y_true, y_pred)
 
             if i > 0 and log_interval > 0 and i % log_interval == 0:
                 # log statistics
-                epoch_loss = np.mean(epoch_losses[-log_interval:])
+                epoch_loss = collector.mean_loss(i + 1 - log_interval, i + 1)
                 log_string = f'[{run_type}][{epoch + 1}, {i + 1:>5}] '
                 log_string += f'loss: {epoch_loss:.4f}'
                 print(log_string)
                 self.total_steps[run_type] += log_interval
                 self.writer.add_scalar(f'Loss/{run_type}', epoch_loss, self.total_steps[run_type])
 
-        return epoch_losses, epoch_y_true, epoch_y_pred
+        self.epoch_samples = collector.num_seen
+        return collector.result()
 
 
-    def test(self, dataloader):
+    def test(self, dataloader, collect=True):
         self.model.eval()
-        test_losses = []
-        test_y_true = []
-        test_y_pred = []
-
-        # iterate over all dataloader, one batch at a time
-        for i, (inputs, y_true) in enumerate(dataloader):
-            # pre-processing
-            if self.runner_type == self.RUNNER_TYPES['CLS']:
-                inputs, y_true = inputs.to(dtype=torch.float32, device=device), y_true.to(device=device)
-                y_true = y_true + 128
-            elif self.runner_type == self.RUNNER_TYPES['REG']:
-                inputs, y_true = inputs.to(dtype=torch.float32, device=device), y_true.unsqueeze(1).to(dtype=torch.float32, device=device)
-            else:
-                raise Exception('Runner Error: runner_type undefined')
-
-            # forward pass
-            y_pred = self.model(inputs)
-            # calculate loss
-            loss = self.criterion(y_pred, y_true)
-
-            # post-processing
-            test_losses.append(loss.item())
-            test_y_true += y_true.tolist()
-            test_y_pred += y_pred.tolist()
-
-        return test_losses, test_y_true, test_y_pred
+        collector = BatchCollector(len(dataloader), len(dataloader.dataset), collect)
+
+        with torch.no_grad():
+            # iterate over all dataloader, one batch at a time
+            for i, (inputs, y_true) in enumerate(dataloader):
+                # pre-processing
+                if self.runner_type == self.RUNNER_TYPES['CLS']:
+                    inputs, y_true = inputs.to(dtype=torch.float32, device=device), y_true.to(device=device)
+                    y_true = y_true + 128
+                elif self.runner_type == self.RUNNER_TYPES['REG']:
+                    inputs, y_true = inputs.to(dtype=torch.float32, device=device), y_true.unsqueeze(1).to(dtype=torch.float32, device=device)
+                else:
+                    raise Exception('Runner Error: runner_type undefined')
+
+                with self.autocast():
+                    # forward pass
+                    y_pred = self.model(inputs)
+                    # calculate loss
+                    loss = self.criterion(y_pred, y_true)
+
+                # post-processing
+                collector.add(i, loss, y_true, y_pred)
+
+        return collector.result()
 
     def inference(self, dataloader):
         self.model.eval()
-        y_preds = []
-        # iterate over all dataloader, one batch at a time
-        for i, (inputs, y_true) in enumerate(dataloader):
-            # pre-processing
-            inputs = inputs.to(dtype=torch.float32, device=device)
-            # forward pass (inference)
-            y_pred = self.model(inputs)
-            # append to list
-            y_preds += y_pred.tolist()
-        return np.array(y_preds)
+        collector = BatchCollector(len(dataloader), len(dataloader.dataset))
+        with torch.no_grad():
+            # iterate over all dataloader, one batch at a time
+            for i, (inputs, y_true) in enumerate(dataloader):
+                # pre-processing
+                inputs = inputs.to(dtype=torch.float32, device=device)
+                # forward pass (inference)
+                with self.autocast():
+                    y_pred = self.model(inputs)
+                # write into preallocated predictions
+                collector.add(i, None, y_pred=y_pred)
+        return collector.result()[2]
@@ -0,0 +1,114 @@
+"""
+Hyperparameter sweep for ChessNetRegression.
+Trials run concurrently in a process pool with a thread cap per trial, weak trials are stopped early with
+successive halving: every rung trains surviving trials for more epochs (resuming their checkpoints) and keeps the best 1/eta.
+"""
+
+import os
+import csv
+import time
+import shutil
+import random
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+
+SEARCH_SPACE = {
+    'num_hidden_layers': [1, 2, 3],
+    'use_reduction': [True, False],
+    'lr': [0.001, 0.0003],
+    'optimizer': ['Adam', 'SGD'],
+    'batch_size': [64, 256],
+}
+
+"""# Trials"""
+
+def grid_trials(space):
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[key] for key in keys))]
+
+def random_trials(space, num_trials, seed=0):
+    rng = random.Random(seed)
+    return [{key: rng.choice(values) for key, values in space.items()} for _ in range(num_trials)]
+
+def init_worker(threads_per_trial):
+    import torch
+    torch.set_num_threads(threads_per_trial)
+    torch.set_num_interop_threads(1)
+
+def run_trial(trial_id, config, epochs, work_root, data_path='data.npz', mmap=False):
+    """Trains trial up to `epochs` epochs in total, continuing from its latest checkpoint, returns its validation loss."""
+    # imported in worker process, so the parent process of the sweep does not need torch
+    import numpy as np
+    import torch
+    import torch.nn as nn
+    import torch.optim as optim
+    from dataset import build_datasets, build_dataloaders
+    from model import ChessNetRegression
+    from runner import Runner
+
+    start_time = time.time()
+    datasets = build_datasets(data_path, mmap)
+    train_dataloader, val_dataloader, _ = build_dataloaders(datasets, batch_size=config['batch_size'], shuffle_train=True)
+    torch.manual_seed(trial_id)
+    runner = Runner(runner_type='REG',
+                    work_dir=os.path.join(work_root, f'trial-{trial_id:03d}'),
+                    model=ChessNetRegression(num_hidden_layers=config['num_hidden_layers'], use_reduction=config['use_reduction']),
+                    criterion=nn.L1Loss(),
+                    optimizer=getattr(optim, config['optimizer']), lr=config['lr'],
+                    save_weight_file='ChessNet.pth', load_weight_file='ChessNet-none.pth',
+                    keep_last_checkpoints=1, resume_from='latest')
+    runner.train(train_loader=train_dataloader, epochs=epochs, log_interval=0)
+    val_losses, _, _ = runner.test(val_dataloader, collect=False)
+    return {'trial': trial_id, **config, 'epochs': epochs, 'val_loss': float(np.mean(val_losses)), 'seconds': time.time() - start_time}
+
+"""# Successive halving"""
+
+def successive_halving(trials, work_root, num_workers=None, min_epochs=1, eta=3, max_epochs=27, data_path='data.npz', mmap=False, overwrite=False):
+    """Returns one result row per trial and rung, trials of the last rung are the winners.
+    Trials resume their own checkpoints between rungs, so work_root must not hold trials of an earlier sweep:
+    a non-empty work_root is refused, or cleared first with overwrite=True."""
+    if os.path.isdir(work_root) and os.listdir(work_root):
+        if not overwrite:
+            raise FileExistsError(f'{work_root} is not empty, trials would resume checkpoints of an earlier sweep; '
+                                  'use another work_root or overwrite=True')
+        shutil.rmtree(work_root)
+    num_workers = num_workers or os.cpu_count()
+    threads_per_trial = max(1, os.cpu_count() // num_workers)
+    results = []
+    survivors = list(enumerate(trials))
+    epochs = min_epochs
+    start_time = time.time()
+    # spawn, forked workers would inherit torch thread pools of the parent
+    with ProcessPoolExecutor(num_workers, mp_context=mp.get_context('spawn'),
+                             initializer=init_worker, initargs=(threads_per_trial,)) as executor:
+        while survivors:
+            futures = [executor.submit(run_trial, trial_id, config, epochs, work_root, data_path, mmap) for trial_id, config in survivors]
+            rung = sorted((future.result() for future in futures), key=lambda row: row['val_loss'])
+            results += rung
+            print(f'[rung epochs={epochs}] trials: {len(rung)}, best val_loss: {rung[0]["val_loss"]:.4f}, '
+                  f'elapsed: {time.time() - start_time:.1f}s')
+            if len(rung) == 1 or epochs >= max_epochs:
+                break
+            keep = {row['trial'] for row in rung[:max(1, len(rung) // eta)]}
+            survivors = [(trial_id, config) for trial_id, config in survivors if trial_id in keep]
+            epochs = min(epochs * eta, max_epochs)
+    print(f'[sweep] wall-clock: {time.time() - start_time:.1f}s, sum of trial times: {sum(row["seconds"] for row in results):.1f}s')
+    return results
+
+def save_results(results, path):
+    with open(path, 'w', newline='') as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+    print('saved results at', path)
+
+if __name__ == '__main__':
+    trials = grid_trials(SEARCH_SPACE)
+    # trials = random_trials(SEARCH_SPACE, num_trials=20)
+    # new directory per sweep, an existing one is refused (or cleared with overwrite=True)
+    work_root = time.strftime('./sweep-%Y%m%d-%H%M%S')
+    results = successive_halving(trials, work_root, num_workers=4, min_epochs=1, eta=3, max_epochs=27)
+    save_results(results, os.path.join(work_root, 'results.csv'))
+    for row in sorted(results, key=lambda row: (-row['epochs'], row['val_loss']))[:5]:
+        print(row)
@@ -3,7 +3,7 @@ Original file is located at
 https://colab.research.google.com/drive/1d9oBD1JE3hI3TeIYlYJIycrsxOL6Tljs
 """
 
-from dataset import train_dataset, val_dataset, test_dataset, train_dataloader, val_dataloader, test_dataloader
+from dataset import build_datasets, build_dataloaders
 from model import ChessNetRegression
 from runner import Runner
 
@@ -22,6 +22,9 @@ print('device:', device)
 
 """# Train"""
 
+train_dataset, val_dataset, test_dataset = build_datasets('data.npz')
+train_dataloader, val_dataloader, test_dataloader = build_dataloaders((train_dataset, val_dataset, test_dataset), batch_size=64)
+
 print('[train_dataset]', len(train_dataset))
 print('[val_dataset]', len(val_dataset))
 print('[test_dataset]', len(test_dataset))
@@ -38,7 +41,9 @@ regression_runner = Runner(runner_type='REG',
                            model=ChessNetRegression(num_hidden_layers=3, use_reduction=True), 
                            criterion=nn.L1Loss(), 
                            optimizer=optim.Adam, lr=0.001, 
-                           save_weight_file='ChessNet-02.pth', load_weight_file='ChessNet-01.pth')
+                           save_weight_file='ChessNet-02.pth', load_weight_file='ChessNet-01.pth',
+                           # continue a preempted run from its newest checkpoint, if there is one
+                           checkpoint_interval=1000, resume_from='latest')
 
 print(regression_runner.model)
 
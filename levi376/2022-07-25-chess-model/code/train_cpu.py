@@ -0,0 +1,86 @@
+"""
+Train ChessNetRegression on CPU only machines.
+Several local processes run DistributedDataParallel with gloo backend, each on its own shard of the train indices.
+"""
+
+from dataset import ChessDataset, build_datasets, batch_dataloader
+from model import ChessNetRegression
+from runner import Runner, configure_cpu_threads
+
+# general libraries
+import os
+import time
+
+# deep learning libraries
+import torch
+import torch.nn as nn
+import torch.optim as optim
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel
+
+"""# Shard train indices, every rank gets the same number of samples so all ranks run the same number of steps"""
+
+def shard_dataset(dataset, rank, world_size, max_samples=None):
+    indices = dataset.indices[:max_samples] if max_samples else dataset.indices
+    shard_size = len(indices) // world_size
+    return ChessDataset(dataset.X, dataset.y, indices[rank::world_size][:shard_size])
+
+"""# One training process"""
+
+def train_worker(rank, world_size, runner_kwargs, model_kwargs, data_path='data.npz', mmap=False,
+                 batch_size=64, epochs=1, log_interval=1000, threads_per_worker=None, max_train_samples=None,
+                 validate=True, port=29500, results=None):
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(port)
+    # threads are split between processes, inter-op parallelism is not useful for a stack of linear layers
+    configure_cpu_threads(threads_per_worker or max(1, os.cpu_count() // world_size), 1)
+    if world_size > 1:
+        dist.init_process_group('gloo', rank=rank, world_size=world_size)
+
+    train_dataset, val_dataset, _ = build_datasets(data_path, mmap)
+    train_shard = shard_dataset(train_dataset, rank, world_size, max_train_samples)
+    # same seed in every rank, shards differ so every rank sees different samples each epoch
+    train_loader = batch_dataloader(train_shard, batch_size=batch_size, shuffle=True, seed=0)
+    val_loader = batch_dataloader(val_dataset, batch_size=batch_size) if rank == 0 and validate else None
+
+    torch.manual_seed(0)
+    runner = Runner(model=ChessNetRegression(**model_kwargs), rank=rank, **runner_kwargs)
+    if world_size > 1:
+        # the model has no buffers, so only rank 0 can run validation without waiting for other ranks
+        runner.model = DistributedDataParallel(runner.model, broadcast_buffers=False)
+
+    start_time = time.time()
+    runner.train(train_loader=train_loader, val_loader=val_loader, epochs=epochs, log_interval=log_interval)
+    elapsed = time.time() - start_time
+
+    if rank == 0 and results is not None:
+        results.put({'world_size': world_size, 'seconds': elapsed, 'samples': len(train_shard) * world_size * epochs})
+    if world_size > 1:
+        dist.destroy_process_group()
+
+"""# Start world_size local processes"""
+
+def train_ddp_cpu(world_size, runner_kwargs, model_kwargs, **kwargs):
+    """Returns dict with number of trained samples and seconds taken by rank 0."""
+    results = mp.get_context('spawn').SimpleQueue()
+    args = (world_size, runner_kwargs, model_kwargs)
+    if world_size == 1:
+        train_worker(0, *args, results=results, **kwargs)
+    else:
+        worker_kwargs = dict(kwargs, results=results)
+        mp.spawn(_spawn_worker, args=(args, worker_kwargs), nprocs=world_size, join=True)
+    return results.get()
+
+def _spawn_worker(rank, args, kwargs):
+    train_worker(rank, *args, **kwargs)
+
+if __name__ == '__main__':
+    runner_kwargs = dict(runner_type='REG',
+                         work_dir='./regression_model',
+                         criterion=nn.L1Loss(),
+                         optimizer=optim.Adam, lr=0.001,
+                         save_weight_file='ChessNet-02.pth', load_weight_file='ChessNet-01.pth')
+    model_kwargs = dict(num_hidden_layers=3, use_reduction=True)
+    result = train_ddp_cpu(4, runner_kwargs, model_kwargs, data_path='data.npz', batch_size=64, epochs=50, log_interval=1000)
+    print('[samples/s]', result['samples'] / result['seconds'])
@@ -0,0 +1,67 @@
+import os
+import csv
+
+# append-only CSV writer used by both scraping scripts
+# rows are buffered and appended in batches, the existing file is never read back or rewritten
+class AppendCsvWriter:
+    def __init__(self, path, columns, batch_size=25, fsync=True):
+        self.path = path
+        self.columns = columns
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.rows = []
+        self.num_written = 0
+        self.repair()
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not is_new:
+            self.check_header()
+        self.file = open(path, 'a', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file, lineterminator='\n')
+        if is_new:
+            self.writer.writerow(columns)
+            self.sync()
+
+    # a crash while appending can leave a partial last line, it is cut off so the file stays valid CSV
+    def repair(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, 'rb+') as csv_file:
+            csv_file.seek(-1, os.SEEK_END)
+            if csv_file.read(1) == b'\n':
+                return
+            size = csv_file.tell()
+            start = max(0, size - (1 << 20))
+            csv_file.seek(start)
+            last_newline = csv_file.read(size - start).rfind(b'\n')
+            csv_file.truncate(start + last_newline + 1 if last_newline >= 0 else 0)
+            print('[AppendCsvWriter] removed partial last row of', self.path)
+
+    def check_header(self):
+        with open(self.path, newline='', encoding='utf-8') as csv_file:
+            header = next(csv.reader(csv_file), [])
+        if header != self.columns:
+            raise ValueError(f'{self.path} has columns {header}, expected {self.columns}')
+
+    # missing columns and NaN values are written as empty fields, like pandas to_csv does
+    def append(self, row):
+        self.rows.append(['' if row.get(column) is None or row.get(column) != row.get(column) else row[column]
+                          for column in self.columns])
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        self.writer.writerows(self.rows)
+        self.num_written += len(self.rows)
+        self.rows = []
+        self.sync()
+
+    def sync(self):
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.flush()
+        self.file.close()
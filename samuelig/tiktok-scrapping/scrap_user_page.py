@@ -3,6 +3,7 @@ import time
 import pandas as pd
 
 from tqdm import tqdm
+from csv_append import AppendCsvWriter
 from urllib import parse
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
@@ -17,39 +18,67 @@ def expand_number(str_num):
         num = num * 1e6
     return int(num)
 
+def count_lines(path):
+    with open(path, 'rb') as count_file:
+        return sum(block.count(b'\n') for block in iter(lambda: count_file.read(1 << 20), b''))
+
+# video links already in USER_PAGE_DATA_CSV_PATH, kept in a set so a lookup is O(1) and matches the exact link
+# the set is loaded once per run from the link index file next to the CSV; the CSV is the source of truth,
+# so the set is rebuilt from its video_link column if there is no index yet, or the index is older than the CSV
+# (a crash between appending rows and saving their links) or does not have one line per CSV row (CSV reset)
+def load_seen_video_links():
+    if not os.path.exists(USER_PAGE_DATA_CSV_PATH):
+        # stale index of a deleted CSV would block every link
+        save_seen_video_links([], mode='w')
+        return set()
+    if (os.path.exists(USER_PAGE_LINKS_PATH)
+            and os.path.getmtime(USER_PAGE_LINKS_PATH) >= os.path.getmtime(USER_PAGE_DATA_CSV_PATH)
+            # rows of this CSV have no line breaks inside fields, so lines minus header are rows
+            and count_lines(USER_PAGE_LINKS_PATH) == max(count_lines(USER_PAGE_DATA_CSV_PATH) - 1, 0)):
+        with open(USER_PAGE_LINKS_PATH) as links_file:
+            return set(line.strip() for line in links_file if line.strip())
+    print('[load_seen_video_links] rebuilding', USER_PAGE_LINKS_PATH, 'from', USER_PAGE_DATA_CSV_PATH)
+    seen_video_links = set(pd.read_csv(USER_PAGE_DATA_CSV_PATH, usecols=['video_link'])['video_link'])
+    save_seen_video_links(seen_video_links, mode='w')
+    return seen_video_links
+
+# new links are appended, so the index file is never rewritten during a run
+def save_seen_video_links(video_links, mode='a'):
+    with open(USER_PAGE_LINKS_PATH, mode) as links_file:
+        for video_link in video_links:
+            links_file.write(video_link + '\n')
+
 def scrap_videos_div(following, followers, likes):
     TAG = '[scrap_videos_div]'
-    columns = ['username', 'following', 'followers', 'likes', 'video_views', 'video_link', 'scrap_date', 'scrap_time']
-    if os.path.exists(USER_PAGE_DATA_CSV_PATH):
-        df_user_page_data = pd.read_csv(USER_PAGE_DATA_CSV_PATH)
-    else:
-        df_user_page_data = pd.DataFrame(columns=columns)
-    
     # get links of all videos on page loaded so far
     videos_div = driver.find_elements(By.CSS_SELECTOR, 'div.tiktok-x6y88p-DivItemContainerV2.e1z53d07')
     print(TAG, '[videos_div]', len(videos_div))
-    new_rows = {'video_views': [], 'video_link': [], 'scrap_date': [], 'scrap_time': []}
+    new_video_links = []
     for i, video_div in tqdm(enumerate(videos_div), total=len(videos_div)):
         video_link_tag = video_div.find_element(By.CSS_SELECTOR, 'a')
         video_link = video_link_tag.get_attribute('href').strip()
-        if not df_user_page_data['video_link'].str.contains(video_link).any():
+        if video_link not in seen_video_links:
+            seen_video_links.add(video_link)
             video_views_tag = video_div.find_element(By.CSS_SELECTOR, 'strong.video-count.tiktok-1p23b18-StrongVideoCount.eor0hs42')
             video_views = expand_number(video_views_tag.text.strip())
             current_datetime = pd.Timestamp(time.time(), unit='s', tz=TIMEZONE)
-            new_rows['video_views'].append(video_views)
-            new_rows['video_link'].append(video_link)
-            new_rows['scrap_date'].append(current_datetime.date())
-            new_rows['scrap_time'].append(current_datetime.time())
-
-    new_rows = pd.DataFrame(new_rows)
-    new_rows['username'] = username
-    new_rows['following'] = following
-    new_rows['followers'] = followers
-    new_rows['likes'] = likes
-    print(TAG, '[new_rows]', new_rows.shape)
-    df_user_page_data = pd.concat([df_user_page_data, new_rows], ignore_index=True)
-    df_user_page_data.to_csv(USER_PAGE_DATA_CSV_PATH, index=False)
-    print(TAG, '[df_user_page_data]\n', df_user_page_data)
+            user_page_writer.append({
+                'username': username,
+                'following': following,
+                'followers': followers,
+                'likes': likes,
+                'video_views': video_views,
+                'video_link': video_link,
+                'scrap_date': current_datetime.date(),
+                'scrap_time': current_datetime.time(),
+            })
+            new_video_links.append(video_link)
+
+    # only new rows are appended to the CSV file
+    user_page_writer.flush()
+    # index is saved after the CSV, so it never lists a link which is not in the CSV
+    save_seen_video_links(new_video_links)
+    print(TAG, '[new_rows]', len(new_video_links), '[total_rows_written]', user_page_writer.num_written)
 
 def scrap_user_page(username):
     TAG = '[scrap_user_page]'
@@ -113,6 +142,12 @@ BASE_PATH = 'scrapped-data'
 if not os.path.exists(BASE_PATH):
     os.mkdir(BASE_PATH)
 USER_PAGE_DATA_CSV_PATH = os.path.join(BASE_PATH, 'df_user_page_data.csv')
+USER_PAGE_COLUMNS = ['username', 'following', 'followers', 'likes', 'video_views', 'video_link', 'scrap_date', 'scrap_time']
+USER_PAGE_LINKS_PATH = os.path.join(BASE_PATH, 'df_user_page_data.links.txt')
+seen_video_links = load_seen_video_links()
+print('[seen_video_links]', len(seen_video_links))
+# rows of one scrap_videos_div call are flushed together, batch_size only bounds rows held in memory
+user_page_writer = AppendCsvWriter(USER_PAGE_DATA_CSV_PATH, USER_PAGE_COLUMNS, batch_size=1000, fsync=True)
 
 usernames = ['fernandassep', 'omfgitsrama', 'laslocurasdeleoyara']
 service = Service('/Users/abdulrehmankhan/Programs/chromedriver')
@@ -123,7 +158,10 @@ options = webdriver.ChromeOptions()
 driver = webdriver.Chrome(service=service, options=options)
 driver.set_window_rect(290, 0, 1150, 800)
 
-for username in usernames:
-    scrap_user_page(username)
+try:
+    for username in usernames:
+        scrap_user_page(username)
+finally:
+    user_page_writer.close()
 
 print('[end]')
@@ -1,6 +1,7 @@
 import os
 import pandas as pd
 
+from csv_append import AppendCsvWriter
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
@@ -16,46 +17,43 @@ def expand_number(str_num):
 
 def scrap_video_page(df_user_page_data):
     TAG = '[scrap_video_page]'
-    columns = ['username', 'following', 'followers', 'likes', 'video_views', 'video_link', 'scrap_date', 'scrap_time', 'video_description', 'video_likes', 'video_comments', 'video_shares']
     mapping = {'like-count': 'video_likes', 'comment-count': 'video_comments', 'share-count': 'video_shares'}
+    # links already scraped are read once, only the video_link column
     if os.path.exists(TIKTOK_SCRAP_DATA_CSV_PATH):
-        df_tiktok_scrap_data = pd.read_csv(TIKTOK_SCRAP_DATA_CSV_PATH)
+        scraped_video_links = set(pd.read_csv(TIKTOK_SCRAP_DATA_CSV_PATH, usecols=['video_link'])['video_link'])
     else:
-        df_tiktok_scrap_data = pd.DataFrame(columns=columns)
-    print(TAG, '[df_tiktok_scrap_data]', df_tiktok_scrap_data)
-    new_rows = {key: [] for key in columns}
-    for idx, row in df_user_page_data.iterrows():
-        video_link = row['video_link']
-        print(TAG, '[idx]', idx, '[video_link]', video_link)
-        if not df_tiktok_scrap_data['video_link'].str.contains(video_link).any():
+        scraped_video_links = set()
+    print(TAG, '[scraped_video_links]', len(scraped_video_links))
+    # new rows are appended every 25 videos, a crash loses at most the current batch
+    writer = AppendCsvWriter(TIKTOK_SCRAP_DATA_CSV_PATH, TIKTOK_SCRAP_COLUMNS, batch_size=25, fsync=True)
+    try:
+        for idx, row in df_user_page_data.iterrows():
+            video_link = row['video_link']
+            print(TAG, '[idx]', idx, '[video_link]', video_link)
+            if video_link in scraped_video_links:
+                continue
             # copy relevant data from df_user_page_data
-            user_page_data_row = df_user_page_data.loc[df_user_page_data['video_link'] == video_link]
-            for col in user_page_data_row.columns:
-                value = user_page_data_row[col].values.tolist()
-                value = value[0] if type(value) is list else value
-                new_rows[col].append(value)
-            
+            new_row = row.to_dict()
+
             # goto video_link
             driver.get(video_link)
             # get video description
             video_container = driver.find_element(By.CSS_SELECTOR, 'div.tiktok-10gdph9-DivContentContainer.e1eulw5o1')
             video_description = video_container.find_element(By.CSS_SELECTOR, 'div.tiktok-1ejylhp-DivContainer.e11995xo0')
-            new_rows['video_description'].append(repr(video_description.text))
+            new_row['video_description'] = repr(video_description.text)
             # get video statistics
             video_stats_divs = video_container.find_elements(By.CSS_SELECTOR, 'strong.tiktok-1y2yo26-StrongText.e1bs7gq22')
             for i, video_stat_div in enumerate(video_stats_divs):
                 video_stat_text = video_stat_div.text.strip()
                 video_stat_text = expand_number(video_stat_text) if 48 <= ord(video_stat_text[0]) <= 57 else 0
                 video_stat_data = video_stat_div.get_attribute('data-e2e')
-                new_rows[mapping[video_stat_data]].append(video_stat_text)
-
-        # save csv file after every 100 iterations
-        if idx > 0 and idx % 25 == 0:
-            new_rows = pd.DataFrame(new_rows, columns=columns)
-            print(TAG, '[new_rows]', new_rows.shape)
-            df_tiktok_scrap_data = pd.concat([df_tiktok_scrap_data, new_rows], ignore_index=True)
-            df_tiktok_scrap_data.to_csv(TIKTOK_SCRAP_DATA_CSV_PATH, index=False)
-            new_rows = {key: [] for key in columns}
+                new_row[mapping[video_stat_data]] = video_stat_text
+            writer.append(new_row)
+            scraped_video_links.add(video_link)
+    finally:
+        # remaining rows of last batch
+        writer.close()
+    print(TAG, '[new_rows]', writer.num_written)
 
 print('[starts]')
 
@@ -66,6 +64,8 @@ if not os.path.exists(BASE_PATH):
     os.mkdir(BASE_PATH)
 USER_PAGE_DATA_CSV_PATH = os.path.join(BASE_PATH, 'df_user_page_data.csv')
 TIKTOK_SCRAP_DATA_CSV_PATH = os.path.join(BASE_PATH, 'tiktok_scrap_data.csv')
+TIKTOK_SCRAP_COLUMNS = ['username', 'following', 'followers', 'likes', 'video_views', 'video_link', 'scrap_date', 'scrap_time',
+                        'video_description', 'video_likes', 'video_comments', 'video_shares']
 
 usernames = ['fernandassep', 'omfgitsrama', 'laslocurasdeleoyara']
 service = Service('/Users/abdulrehmankhan/Programs/chromedriver')